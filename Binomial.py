@@ -0,0 +1,210 @@
+# Lattice option pricers: Cox-Ross-Rubinstein and Leisen-Reimer binomial trees and a trinomial tree
+# Backward induction runs in place on one vector of node values per contract, so memory is O(steps),
+# and many contracts with the same number of steps are rolled back together as the rows of one array
+# European, American and Bermudan exercise, calls and puts
+
+import time
+import numpy as np
+from BlackScholes import broadcast_inputs, probability_factors, batch_option_pricer
+
+LATTICES = ('crr', 'leisen-reimer', 'trinomial')
+EXERCISE = ('european', 'american', 'bermudan')
+# Convergence order in the step count for european options, used by Richardson extrapolation
+# With early exercise the exercise boundary limits every lattice to first order
+ORDER = {'crr': 1, 'leisen-reimer': 2, 'trinomial': 1}
+
+# Peizer-Pratt method 2 inversion, the binomial probability matching the normal probability N(z) on n steps
+def peizer_pratt(z, n):
+    correction = z / (n + 1 / 3 + 0.1 / (n + 1))
+    return 0.5 + np.sign(z) * np.sqrt(0.25 - 0.25 * np.exp(-correction * correction * (n + 1 / 6)))
+
+# Leisen-Reimer needs an odd number of steps, the tree is centred on the strike
+def lattice_steps(steps, lattice):
+    if lattice == 'leisen-reimer' and steps % 2 == 0:
+        return steps + 1
+    return steps
+
+# Up and down factors and probabilities for every contract, one column per contract
+def binomial_parameters(s, k, t, r, v, steps, lattice):
+    dt = t / steps
+    growth = np.exp(r * dt)
+    if lattice == 'crr':
+        up = np.exp(v * np.sqrt(dt))
+        down = 1 / up
+        probability = (growth - down) / (up - down)
+    else:
+        d1, d2, _ = probability_factors(s, k, t, r, v)
+        probability = peizer_pratt(d2, steps)
+        up = growth * peizer_pratt(d1, steps) / probability
+        down = (growth - probability * up) / (1 - probability)
+    return up, down, probability
+
+# Steps at which early exercise is allowed, a boolean mask over steps 0..steps for every contract,
+# None for european options
+def exercise_steps(exercise, exercise_times, t, steps):
+    if exercise == 'european':
+        return None
+    allowed = np.zeros((len(t), steps + 1), dtype=bool)
+    if exercise == 'american':
+        allowed[:] = True
+    else:
+        if exercise_times is None:
+            raise ValueError('Warning: bermudan exercise needs exercise times')
+        # Nearest step of each contract to each exercise date, dates after maturity are dropped
+        times = np.asarray(exercise_times, dtype=float).reshape(1, -1)
+        nearest = np.rint(times / t * steps).astype(int)
+        rows = np.broadcast_to(np.arange(len(t))[:, np.newaxis], nearest.shape)
+        alive = (times <= t) & (times >= 0)
+        allowed[rows[alive], nearest[alive]] = True
+    return allowed
+
+# Node values at the last step before maturity, the intrinsic value at maturity rolled back one step,
+# or with smoothing the Black-Scholes price over the last step, which removes the odd-even oscillation
+# of the lattice price in the step count (needed for Richardson extrapolation to pay off)
+def terminal_values(stock, k, t, r, v, sign, steps, smoothing, allowed):
+    if not smoothing:
+        return np.maximum(sign * (stock - k), 0)
+    call, put = batch_option_pricer(stock, k, t / steps, r, v)
+    values = np.where(sign > 0, call, put)
+    if allowed is not None:
+        values = np.where(allowed[:, [steps - 1]], np.maximum(values, sign * (stock - k)), values)
+    return values
+
+# Price options on a lattice, inputs are broadcast against each other like BlackScholes.batch_option_pricer
+# call is a bool or an array of bools, exercise is european, american or bermudan at exercise_times
+# (in years, shared by all contracts and mapped to the nearest step of each contract)
+# smoothing prices the last step with Black-Scholes, see terminal_values
+def lattice_option_pricer(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, steps=500,
+                          call=True, exercise='european', exercise_times=None, lattice='crr', smoothing=False):
+    if lattice not in LATTICES:
+        raise ValueError('Warning: lattice must be one of ' + str(LATTICES))
+    if exercise not in EXERCISE:
+        raise ValueError('Warning: exercise must be one of ' + str(EXERCISE))
+    if steps < 1:
+        raise ValueError('Warning: at least one step is needed')
+    steps = lattice_steps(steps, lattice)
+
+    s, k, t, r, v, call = np.broadcast_arrays(*broadcast_inputs(stock_price, strike_price, time_to_maturity,
+                                                                risk_free_rate, volatility), np.asarray(call))
+    shape = s.shape
+    # One row per contract
+    s, k, t, r, v = (a.reshape(-1, 1) for a in (s, k, t, r, v))
+    sign = np.where(call.reshape(-1, 1), 1.0, -1.0)
+    discount = np.exp(-r * t / steps)
+
+    if lattice == 'trinomial':
+        prices = trinomial_rollback(s, k, t, r, v, sign, discount, steps, exercise, exercise_times, smoothing)
+    else:
+        prices = binomial_rollback(s, k, t, r, v, sign, discount, steps, exercise, exercise_times, lattice, smoothing)
+
+    if len(shape) == 0:
+        return float(prices[0])
+    return prices.reshape(shape)
+
+# Backward induction on a binomial tree, node i of step j has stock price S u^i d^(j-i)
+def binomial_rollback(s, k, t, r, v, sign, discount, steps, exercise, exercise_times, lattice, smoothing):
+    up, down, probability = binomial_parameters(s, k, t, r, v, steps, lattice)
+    up_weight = discount * probability
+    down_weight = discount * (1 - probability)
+
+    allowed = exercise_steps(exercise, exercise_times, t, steps)
+    # With smoothing the induction starts one step before maturity
+    last = steps - 1 if smoothing else steps
+    nodes = np.arange(last + 1)
+    stock = s * up ** nodes * down ** (last - nodes)
+    values = terminal_values(stock, k, t, r, v, sign, steps, smoothing, allowed)
+    buffer = np.empty_like(values)
+
+    for j in range(last, 0, -1):
+        # Values at step j - 1 overwrite the first j nodes of step j
+        current, upper = values[:, :j], values[:, 1:j + 1]
+        np.multiply(upper, up_weight, out=buffer[:, :j])
+        current *= down_weight
+        current += buffer[:, :j]
+        if allowed is not None:
+            # Stock prices at step j - 1 from those at step j
+            stock[:, :j] /= down
+            rows = allowed[:, j - 1]
+            if rows.any():
+                np.multiply(stock[:, :j] - k, sign, out=buffer[:, :j])
+                np.maximum(current, buffer[:, :j], out=current, where=rows[:, np.newaxis])
+    return values[:, 0]
+
+# Backward induction on a trinomial tree with u = exp(sigma sqrt(2 dt)), d = 1 / u and a middle branch,
+# node i of step j has stock price S u^(i - j)
+def trinomial_rollback(s, k, t, r, v, sign, discount, steps, exercise, exercise_times, smoothing):
+    dt = t / steps
+    half = np.exp(v * np.sqrt(dt / 2))
+    drift = np.exp(r * dt / 2)
+    up_probability = ((drift - 1 / half) / (half - 1 / half)) ** 2
+    down_probability = ((half - drift) / (half - 1 / half)) ** 2
+    up_weight = discount * up_probability
+    middle_weight = discount * (1 - up_probability - down_probability)
+    down_weight = discount * down_probability
+    up = half * half
+
+    allowed = exercise_steps(exercise, exercise_times, t, steps)
+    last = steps - 1 if smoothing else steps
+    nodes = np.arange(2 * last + 1)
+    stock = s * up ** (nodes - last)
+    values = terminal_values(stock, k, t, r, v, sign, steps, smoothing, allowed)
+    buffer = np.empty_like(values)
+    spare = np.empty_like(values)
+
+    for j in range(last, 0, -1):
+        width = 2 * j - 1
+        # Both upper branches are read before the first width nodes are overwritten
+        current = values[:, :width]
+        np.multiply(values[:, 1:width + 1], middle_weight, out=buffer[:, :width])
+        np.multiply(values[:, 2:width + 2], up_weight, out=spare[:, :width])
+        buffer[:, :width] += spare[:, :width]
+        current *= down_weight
+        current += buffer[:, :width]
+        if allowed is not None:
+            stock[:, :width] *= up
+            rows = allowed[:, j - 1]
+            if rows.any():
+                np.multiply(stock[:, :width] - k, sign, out=buffer[:, :width])
+                np.maximum(current, buffer[:, :width], out=current, where=rows[:, np.newaxis])
+    return values[:, 0]
+
+# Richardson extrapolation from the lattice prices on steps and steps / 2:
+# the error of a method of order p falls like steps^(-p), so (2^p V(steps) - V(steps / 2)) / (2^p - 1)
+# cancels the leading error term and reaches a given accuracy with far fewer steps
+# CRR and trinomial prices oscillate in the step count, so they are smoothed with Black-Scholes over the
+# last step first (BBSR), Leisen-Reimer converges smoothly already
+def richardson_option_pricer(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, steps=200,
+                             call=True, exercise='european', exercise_times=None, lattice='crr'):
+    smoothing = lattice != 'leisen-reimer'
+    fine = lattice_option_pricer(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility,
+                                 steps, call, exercise, exercise_times, lattice, smoothing)
+    coarse = lattice_option_pricer(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility,
+                                   steps // 2, call, exercise, exercise_times, lattice, smoothing)
+    factor = 2 ** (ORDER[lattice] if exercise == 'european' else 1)
+    return (factor * fine - coarse) / (factor - 1)
+
+# European limit check: lattice prices against Black-Scholes on a grid of contracts,
+# reports the largest error and the time for each lattice and step count
+def validate_against_black_scholes(step_counts=(50, 100, 200, 400, 800), contracts=200, seed=0):
+    rng = np.random.default_rng(seed)
+    s = np.full(contracts, 100.0)
+    k = rng.uniform(70, 130, contracts)
+    t = rng.uniform(0.1, 2.0, contracts)
+    r = rng.uniform(0.0, 0.08, contracts)
+    v = rng.uniform(0.1, 0.5, contracts)
+    call, put = batch_option_pricer(s, k, t, r, v)
+
+    report = {}
+    for lattice in LATTICES:
+        rows = []
+        for steps in step_counts:
+            for name, pricer in (('plain', lattice_option_pricer), ('richardson', richardson_option_pricer)):
+                start = time.perf_counter()
+                lattice_call = pricer(s, k, t, r, v, steps, True, lattice=lattice)
+                lattice_put = pricer(s, k, t, r, v, steps, False, lattice=lattice)
+                elapsed = time.perf_counter() - start
+                error = max(np.max(np.abs(lattice_call - call)), np.max(np.abs(lattice_put - put)))
+                rows.append((name, steps, error, elapsed))
+                print('%s %s, steps: %d, max error: %.2e, seconds: %.4f' % (lattice, name, steps, error, elapsed))
+        report[lattice] = rows
+    return report
@@ -1,5 +1,5 @@
 # Black Scholes pricer
-from scipy import stats
+from scipy import stats, special
 import numpy as np
 
 def put_option_pricer(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility):
@@ -20,3 +20,98 @@ def call_option_pricer(stock_price, strike_price, time_to_maturity, risk_free_ra
     price = stock_price * stats.norm.cdf(d1) - strike_price * np.exp(-risk_free_rate * time_to_maturity) * stats.norm.cdf(d2)
     return price
 
+
+# Batch Black-Scholes pricing
+# Inputs are broadcast against each other, so a whole option chain is priced in one pass
+
+BATCH_INPUTS = ('stock_price', 'strike_price', 'time_to_maturity', 'risk_free_rate', 'volatility')
+
+# Broadcast the batch inputs to one common shape and dtype
+def broadcast_inputs(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, dtype=np.float64):
+    arrays = [np.asarray(a, dtype=dtype) for a in (stock_price, strike_price, time_to_maturity, risk_free_rate, volatility)]
+    return np.broadcast_arrays(*arrays)
+
+# Probability factors d1, d2 shared by calls and puts, together with sigma * sqrt(T)
+def probability_factors(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility):
+    vol_sqrt_t = volatility * np.sqrt(time_to_maturity)
+    d1 = np.log(stock_price / strike_price)
+    d1 += (risk_free_rate + 0.5 * volatility * volatility) * time_to_maturity
+    d1 /= vol_sqrt_t
+    d2 = d1 - vol_sqrt_t
+    return d1, d2, vol_sqrt_t
+
+# Price calls and puts for broadcast arrays of contracts, no printing
+# dtype=np.float32 halves memory on very large chains
+# out=(call_out, put_out) writes the prices into preallocated arrays
+# Scalar inputs return a pair of floats
+def batch_option_pricer(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, dtype=np.float64, out=None):
+    s, k, t, r, v = broadcast_inputs(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, dtype)
+    d1, d2, _ = probability_factors(s, k, t, r, v)
+    # Scalar inputs give numpy scalars, which cannot be negated in place
+    d1, d2 = np.asarray(d1), np.asarray(d2)
+    discounted_strike = np.exp(-r * t)
+    discounted_strike *= k
+
+    if out is None:
+        call = np.empty(s.shape, dtype=dtype)
+        put = np.empty(s.shape, dtype=dtype)
+    else:
+        call, put = out
+        if call.shape != s.shape or put.shape != s.shape:
+            raise ValueError('Warning: output arrays must match the broadcast shape ' + str(s.shape))
+
+    # Call: S N(d1) - K exp(-rT) N(d2)
+    np.multiply(s, special.ndtr(d1), out=call)
+    call -= discounted_strike * special.ndtr(d2)
+    # Put: K exp(-rT) N(-d2) - S N(-d1), reusing d1 and d2 in place
+    np.negative(d1, out=d1)
+    np.negative(d2, out=d2)
+    np.multiply(discounted_strike, special.ndtr(d2), out=put)
+    put -= s * special.ndtr(d1)
+    # Scalar inputs give floats, like the other pricers
+    if s.ndim == 0 and out is None:
+        return float(call), float(put)
+    return call, put
+
+# Price a DataFrame option chain, columns named as in BATCH_INPUTS
+def chain_option_pricer(chain, dtype=np.float64):
+    missing = [c for c in BATCH_INPUTS if c not in chain.columns]
+    if len(missing) > 0:
+        raise ValueError('Warning: option chain is missing columns ' + str(missing))
+    call, put = batch_option_pricer(*(chain[c].to_numpy() for c in BATCH_INPUTS), dtype=dtype)
+    priced = chain.copy()
+    priced['call_price'] = call
+    priced['put_price'] = put
+    return priced
+
+# Analytic Greeks computed alongside the prices in a single pass
+# Reuses d1, d2, N(d) and the discounted strike from the pricing step
+# Theta is per year, vega/rho/volga per unit change in volatility or rate
+def batch_option_greeks(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, dtype=np.float64):
+    s, k, t, r, v = broadcast_inputs(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, dtype)
+    d1, d2, vol_sqrt_t = probability_factors(s, k, t, r, v)
+    discounted_strike = k * np.exp(-r * t)
+
+    cdf_d1 = special.ndtr(d1)
+    cdf_d2 = special.ndtr(d2)
+    cdf_minus_d1 = special.ndtr(-d1)
+    cdf_minus_d2 = special.ndtr(-d2)
+    pdf_d1 = np.exp(-0.5 * d1 * d1) / np.sqrt(2 * np.pi)
+
+    vega = s * pdf_d1 * np.sqrt(t)
+    decay = -0.5 * vega * v / t
+
+    return {
+        'call_price': s * cdf_d1 - discounted_strike * cdf_d2,
+        'put_price': discounted_strike * cdf_minus_d2 - s * cdf_minus_d1,
+        'call_delta': cdf_d1,
+        'put_delta': -cdf_minus_d1,
+        'gamma': pdf_d1 / (s * vol_sqrt_t),
+        'vega': vega,
+        'call_theta': decay - r * discounted_strike * cdf_d2,
+        'put_theta': decay + r * discounted_strike * cdf_minus_d2,
+        'call_rho': t * discounted_strike * cdf_d2,
+        'put_rho': -t * discounted_strike * cdf_minus_d2,
+        'vanna': -pdf_d1 * d2 / v,
+        'volga': vega * d1 * d2 / v,
+    }
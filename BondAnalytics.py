@@ -0,0 +1,105 @@
+# Yield to maturity, duration, convexity and Z-spread for a whole BondPortfolio.BondBook
+# Every bond is solved at once on the book's CSR cash flow layout, bonds drop out of the Newton
+# iterations as they converge
+# Yields are decimals compounded frequency times a year, frequency = 0 for continuous compounding
+
+import numpy as np
+
+TOLERANCE = 1e-10
+MAX_ITERATIONS = 50
+
+# Cash flows of the book as flat arrays: amounts, payment times and the index of the owning bond
+def book_cash_flows(book):
+    matrix = book.matrix
+    owners = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    return matrix.data, book.dates[matrix.indices], owners
+
+# Continuously compounded rate z for every bond with sum of amount * base * exp(-z t) = price
+# The price is convex and decreasing in z, so Newton converges from any start
+# Returns the rates, the iteration count of each bond and whether it converged
+def solve_rates(amounts, times, owners, base, prices, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS, initial=None):
+    bonds = len(prices)
+    values = amounts * base
+    if initial is not None:
+        rates = np.array(initial, dtype=float)
+    else:
+        # Start from the rate of a zero coupon bond paying everything at the value weighted mean time
+        total = np.bincount(owners, values, bonds)
+        mean_time = np.bincount(owners, values * times, bonds) / total
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where((total > 0) & (prices > 0), np.log(total / prices) / mean_time, 0.0)
+    iterations = np.zeros(bonds, dtype=np.int64)
+    converged = np.zeros(bonds, dtype=bool)
+
+    # Cash flows of the bonds still iterating, compacted whenever some bonds converge
+    active = np.arange(bonds)
+    owner, flow_times, flow_values = owners, times, values
+    for _ in range(max_iterations):
+        exponent = rates[active][owner]
+        exponent *= flow_times
+        discounted = np.exp(-exponent, out=exponent)
+        discounted *= flow_values
+        error = np.bincount(owner, discounted, len(active)) - prices[active]
+        discounted *= flow_times
+        slope = -np.bincount(owner, discounted, len(active))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(slope != 0, error / slope, 0.0)
+        rates[active] -= step
+        iterations[active] += 1
+        done = np.abs(step) <= tolerance
+        if done.any():
+            converged[active[done]] = True
+            remaining = ~done
+            if not remaining.any():
+                break
+            keep = remaining[owner]
+            # Renumber the owners of the remaining cash flows
+            owner = (np.cumsum(remaining) - 1)[owner[keep]]
+            flow_times, flow_values = flow_times[keep], flow_values[keep]
+            active = active[remaining]
+    return rates, iterations, converged
+
+
+# Yield to maturity, Macaulay and modified duration, convexity and, against a YieldCurves.YCurve, the Z-spread
+# (continuously compounded spread over the curve's zero rates) of every bond in the book
+# prices default to the book's face values, as everywhere in Bonds
+def bond_analytics(book, ycurve=None, prices=None, frequency=2, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    if frequency < 0:
+        raise ValueError('Warning: negative frequency')
+    prices = book.prices if prices is None else np.asarray(prices, dtype=float)
+    if prices is None or np.any(np.isnan(prices)):
+        raise ValueError('Warning: every bond needs a price')
+    amounts, times, owners = book_cash_flows(book)
+    bonds = len(prices)
+
+    rates, iterations, converged = solve_rates(amounts, times, owners, np.ones(len(amounts)), prices, tolerance, max_iterations)
+    # exp(-z t) is (1 + y / frequency)^(-frequency t) for z = frequency * log(1 + y / frequency)
+    if frequency == 0:
+        yields = rates
+        growth = np.ones(bonds)
+    else:
+        yields = frequency * np.expm1(rates / frequency)
+        growth = 1 + yields / frequency
+
+    discounted = amounts * np.exp(-rates[owners] * times)
+    value = np.bincount(owners, discounted, bonds)
+    macaulay = np.bincount(owners, discounted * times, bonds) / value
+    modified = macaulay / growth
+    if frequency == 0:
+        convexity = np.bincount(owners, discounted * times ** 2, bonds) / value
+    else:
+        convexity = np.bincount(owners, discounted * times * (times + 1 / frequency), bonds) / (value * growth ** 2)
+
+    report = {'yield': yields, 'macaulay_duration': macaulay, 'modified_duration': modified, 'convexity': convexity,
+              'iterations': iterations, 'converged': converged}
+
+    if ycurve is not None:
+        base = ycurve.discount_factor(book.dates)[book.matrix.indices]
+        # The yield less the curve's zero rate at the duration is already close to the spread
+        guess = rates - ycurve.get_yield(macaulay)
+        spreads, spread_iterations, spread_converged = solve_rates(amounts, times, owners, base, prices, tolerance,
+                                                                   max_iterations, guess)
+        report['z_spread'] = spreads
+        report['iterations'] = iterations + spread_iterations
+        report['converged'] = converged & spread_converged
+    return report
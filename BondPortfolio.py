@@ -0,0 +1,116 @@
+# Portfolio bond pricing engine
+# All cash flows of a book are packed into one sparse (bonds x dates) CSR matrix over the unique payment dates,
+# so every distinct date is discounted once and the whole book is priced with one matrix product
+
+import numpy as np
+from scipy import sparse
+from Bonds import Relative
+
+# Payment times are rounded before de-duplication so dates built by different float arithmetic still match
+DATE_DECIMALS = 10
+
+# Payment schedules of many coupon bonds at once, the same schedule as Bonds.construct_coupon_bond:
+# coupons of rate% * face / freq every 1 / freq back from maturity while the date is positive,
+# the face value paid with the last coupon, freq = 0 for a zero coupon bond
+# Returns the CSR row offsets, payment times and amounts
+def coupon_schedules(maturities, face_values, rates, freqs):
+    maturities, face_values, rates, freqs = (a.ravel() for a in np.broadcast_arrays(
+        np.asarray(maturities, dtype=float), np.asarray(face_values, dtype=float),
+        np.asarray(rates, dtype=float), np.asarray(freqs, dtype=np.int64)))
+    if np.any(freqs < 0):
+        raise ValueError('Warning: negative frequency')
+    # A bond without payments would shift its face value onto a neighbour's last cash flow
+    if np.any(maturities <= 0):
+        raise ValueError('Warning: maturities must be positive')
+    counts = np.where(freqs > 0, np.ceil(np.round(maturities * freqs, DATE_DECIMALS)), 1).astype(np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    owners = np.repeat(np.arange(len(counts)), counts)
+    # Periods before maturity, counted from the last payment
+    before = offsets[owners + 1] - 1 - np.arange(offsets[-1])
+    period = np.where(freqs > 0, 1 / np.maximum(freqs, 1), 0.0)
+    times = maturities[owners] - before * period[owners]
+    amounts = np.where(freqs > 0, rates / 100 * face_values / np.maximum(freqs, 1), 0.0)[owners]
+    amounts[offsets[1:] - 1] += face_values
+    return offsets, times, amounts
+
+class BondBook:
+    # offsets, times and amounts are the CSR layout of the cash flows, prices are the bonds' face values
+    def __init__(self, offsets, times, amounts, prices=None):
+        offsets = np.asarray(offsets, dtype=np.int64)
+        times = np.round(np.asarray(times, dtype=float), DATE_DECIMALS)
+        amounts = np.asarray(amounts, dtype=float)
+        if len(times) != len(amounts) or offsets[-1] != len(times):
+            raise ValueError('Warning: cash flow times and amounts mismatch')
+        self.offsets = offsets
+        self.times = times
+        self.amounts = amounts
+        self.prices = None if prices is None else np.asarray(prices, dtype=float)
+
+        # Unique payment dates, and for every cash flow the column of its date
+        self.dates, columns = np.unique(times, return_inverse=True)
+        self.matrix = sparse.csr_matrix((amounts, columns.ravel(), offsets), shape=(len(offsets) - 1, len(self.dates)))
+        # Payments of one bond on the same date are merged
+        self.matrix.sum_duplicates()
+
+    # Book of Bonds.Bond objects
+    @classmethod
+    def from_bonds(cls, bonds):
+        counts = [len(bond.get_times()) for bond in bonds]
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        times = np.concatenate([np.asarray(bond.get_times(), dtype=float) for bond in bonds])
+        amounts = np.concatenate([np.asarray(bond.get_coupons(), dtype=float) for bond in bonds])
+        prices = [np.nan if bond.face_value is None else bond.face_value for bond in bonds]
+        return cls(offsets, times, amounts, prices)
+
+    # Book of coupon bonds from construct_coupon_bond specs, (maturity, face_value, rate, freq) per bond,
+    # with the schedules generated for all bonds at once
+    @classmethod
+    def from_specs(cls, specs):
+        maturities, face_values, rates, freqs = np.asarray(specs, dtype=float).reshape(-1, 4).T
+        offsets, times, amounts = coupon_schedules(maturities, face_values, rates, freqs)
+        return cls(offsets, times, amounts, face_values)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    # Payment times and amounts of one bond
+    def cash_flows(self, index):
+        rows = slice(self.offsets[index], self.offsets[index + 1])
+        return self.times[rows], self.amounts[rows]
+
+    # Bonds.Relative bond with the cash flows of one bond of the book
+    def bond(self, index):
+        face_value = float(self.prices[index]) if self.prices is not None else None
+        times, amounts = self.cash_flows(index)
+        return Relative(rates=list(amounts), times=list(times), face=face_value)
+
+    # Sum of discounted cash flows, factors holds one discount factor per unique date
+    # or one column of factors per curve or scenario
+    def discounted_prices(self, factors):
+        return self.matrix @ factors
+
+    # Prices at time of every bond against one YCurve, or against a list of curves (one column per curve)
+    # Payments before time are dropped
+    def price(self, ycurves, time=0):
+        tenors = self.dates - time
+        alive = tenors >= 0
+        if not isinstance(ycurves, (list, tuple)):
+            factors = np.zeros(len(tenors))
+            factors[alive] = ycurves.discount_factor(tenors[alive])
+            return self.discounted_prices(factors)
+        factors = np.zeros((len(tenors), len(ycurves)))
+        for i, ycurve in enumerate(ycurves):
+            factors[alive, i] = ycurve.discount_factor(tenors[alive])
+        return self.discounted_prices(factors)
+
+    # Prices under many rate scenarios of one curve's pillars, scenarios is (scenarios x pillars)
+    # Interpolation is linear in the pillar rates, so the yields at all dates for all scenarios are one
+    # sparse product with the interpolator Jacobian, returns (bonds x scenarios)
+    def scenario_prices(self, ycurve, scenarios, time=0):
+        scenarios = np.atleast_2d(np.asarray(scenarios, dtype=float))
+        tenors = self.dates - time
+        alive = tenors >= 0
+        factors = np.zeros((len(tenors), scenarios.shape[0]))
+        yields = ycurve.interpolator.jacobian(tenors[alive]) @ scenarios.T
+        factors[alive] = np.exp(-yields * tenors[alive][:, np.newaxis])
+        return self.discounted_prices(factors)
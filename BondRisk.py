@@ -0,0 +1,72 @@
+# Key-rate DV01, parallel DV01 and convexity of a bond book
+# Interpolated yields are linear in the pillar rates, y = J r with the interpolator Jacobian J,
+# so all pillar sensitivities of every bond come out of one sparse product instead of one reprice per pillar
+# DV01 is the price loss for a 1bp rise in rates, convexity is (1 / P) d^2 P / dy^2 for a parallel move
+
+import numpy as np
+
+RISK_METHODS = ('analytic', 'scenarios', 'reprice')
+
+# Sensitivities of every bond in a BondPortfolio.BondBook to the pillars of a YieldCurves.YCurve
+# analytic: exact derivatives through the Jacobian
+# scenarios: central differences, every bumped curve priced in one matrix product with BondBook.scenario_prices
+# reprice: central differences through YCurve.shift_rate and shift_rates, one full reprice per bump, for validation
+# bump is in percent like shift_rate, positions are the holdings of each bond for the portfolio totals
+def key_rate_risk(book, ycurve, method='analytic', bump=0.01, time=0, positions=None):
+    if method not in RISK_METHODS:
+        raise ValueError('Warning: method must be one of ' + str(RISK_METHODS))
+    pillars = ycurve.length
+    step = bump / 100
+
+    if method == 'analytic':
+        tenors = book.dates - time
+        alive = tenors >= 0
+        jacobian = ycurve.interpolator.jacobian(tenors[alive])
+        factors = np.zeros(len(tenors))
+        factors[alive] = ycurve.discount_factor(tenors[alive])
+        prices = book.discounted_prices(factors)
+        # d(price)/d(r_k) = -sum over dates of cash flow * t * DF * J[date, k]
+        weights = np.zeros(len(tenors))
+        weights[alive] = tenors[alive] * factors[alive]
+        # Per unique date first, then one product with the cash flow matrix
+        date_risk = np.zeros((len(tenors), pillars))
+        date_risk[alive] = jacobian.multiply(weights[alive][:, np.newaxis]).toarray()
+        key_rate = -book.discounted_prices(date_risk)
+        # A parallel move shifts every yield by the Jacobian's row sum, which is 1 for all schemes
+        shift = np.zeros(len(tenors))
+        shift[alive] = np.asarray(jacobian.sum(axis=1)).ravel()
+        second = book.discounted_prices(weights * tenors * shift ** 2)
+        dv01 = -key_rate * step
+        parallel = -(key_rate.sum(axis=1)) * step
+
+    else:
+        if method == 'scenarios':
+            rates = np.asarray(ycurve.get_rates(), dtype=float)
+            # Base, each pillar up and down, then everything up and down
+            bumps = np.vstack((np.zeros(pillars), np.eye(pillars) * step, -np.eye(pillars) * step,
+                               np.full(pillars, step), np.full(pillars, -step)))
+            values = book.scenario_prices(ycurve, rates + bumps, time)
+        else:
+            curves = [ycurve]
+            curves += [ycurve.shift_rate(bump, k) for k in range(pillars)]
+            curves += [ycurve.shift_rate(-bump, k) for k in range(pillars)]
+            curves += [ycurve.shift_rates(bump), ycurve.shift_rates(-bump)]
+            values = book.price(curves, time)
+        prices = values[:, 0]
+        up = values[:, 1:pillars + 1]
+        down = values[:, pillars + 1:2 * pillars + 1]
+        dv01 = (down - up) / 2
+        parallel = (values[:, -1] - values[:, -2]) / 2
+        second = (values[:, -2] + values[:, -1] - 2 * prices) / step ** 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        convexity = np.where(prices != 0, second / prices, 0.0)
+    report = {'price': prices, 'key_rate_dv01': dv01, 'dv01': parallel, 'convexity': convexity,
+              'tenors': np.asarray(ycurve.get_tenors(), dtype=float)}
+
+    if positions is not None:
+        positions = np.asarray(positions, dtype=float)
+        value = positions @ prices
+        report['portfolio'] = {'value': value, 'key_rate_dv01': positions @ dv01, 'dv01': positions @ parallel,
+                               'convexity': (positions @ second) / value if value != 0 else 0.0}
+    return report
@@ -1,11 +1,15 @@
+import math
+import numpy as np
 import matplotlib.pyplot as plt
 from computations.YieldCurves import *
 import datetime as dt
 
 class Bond:
     def __init__(self, rates=[], times=[], face=None):
-        self.coupon_rates = rates
-        self.times = times.sort()
+        # Keep the payments in time order, each coupon stays with its payment time
+        order = sorted(range(len(times)), key=lambda i: times[i])
+        self.coupon_rates = [rates[i] for i in order]
+        self.times = [times[i] for i in order]
         self.face_value = face
 
     def construct_bond(self, rates, times):
@@ -55,54 +59,52 @@ class Absolute(Bond):
 
 # Class for relative bonds
 class Relative(Bond):
+    # Present value at time of the payments not yet made, one vectorized discount factor lookup
     def bond_pricer(self, ycurve, time=0):
-        present_value = 0
-        for i in range(len(self.times)):
-            if self.times[i] < time:
-                continue
-            present_value += ycurve.discount_factor(self.times[i] - time) * self.coupon_rates[i]
-        return present_value
+        times = np.asarray(self.times, dtype=float)
+        remaining = times >= time
+        return float(ycurve.discount_factor(times[remaining] - time) @ np.asarray(self.coupon_rates, dtype=float)[remaining])
     
+    # Yield to maturity in percent, compounded at the payment frequency (continuously for a single payment)
+    # BondAnalytics.bond_analytics solves whole books at once
     def yield_to_maturity(self, price=None):
         if price == None:
             price = self.face_value
 
-        if self.face_value == None:
+        if price == None:
             print('No price info')
-        
-        if self.length == 1:
+            return
+
+        if len(self.times) == 1:
             return -100 * math.log(price / self.coupon_rates[0]) / self.times[0]
-        
-        freq = round(1 / (self.times[1] - self.times[0]))
+
+        times = np.asarray(self.times, dtype=float)
+        coupons = np.asarray(self.coupon_rates, dtype=float)
+        freq = round(1 / (times[1] - times[0]))
         tolerance = 0.000001
 
         def f(y):
-            sigma = self.coupon_rates[0] / (1 + y / freq) ** (freq * self.times[0])
-            for i in range(1, self.length):
-                sigma += self.coupon_rates[i] / (1 + y / freq) ** (freq * self.times[i])
-            return sigma - price
-        
+            return coupons @ (1 + y / freq) ** (-freq * times) - price
+
         def f_prime(y):
-            sigma = self.times[0] * self.coupon_rates[0] / (1 + y / freq) ** (freq * self.times[0] + 1)
-            for i in range(1, self.length):
-                sigma += self.times[i] * self.coupon_rates[i] / (1 + y / freq) ** (freq * self.times[i] + 1)
-            return -sigma
-        
+            return -(times * coupons) @ (1 + y / freq) ** (-freq * times - 1)
+
         prev_y = 0
         curr_y = prev_y - f(prev_y) / f_prime(prev_y)
 
         while abs(curr_y - prev_y) > tolerance:
             prev_y = curr_y
             curr_y = prev_y - f(prev_y) / f_prime(prev_y)
-        
+        return 100 * curr_y
+
 
-def construct_bond(dates: list, coupon_rates: list):
+def construct_bond(dates: list, coupon_rates: list, face_value=None):
     if len(dates) != len(coupon_rates):
         print('Warning: dates and rates mismatch')
         return
 
     if all([(type(date) == float) for date in dates]):
-        bond = Relative(rates=coupon_rates, times=dates)
+        bond = Relative(rates=coupon_rates, times=dates, face=face_value)
         return bond
     
     if all([(type(date) == dt.date) for date in dates]):
@@ -119,17 +121,18 @@ def construct_coupon_bond(maturity: float, face_value: float, rate: float, freq:
     if freq == 0:
         payment = [float(face_value)]
         paydate = [float(maturity)]
-        bond = construct_bond(paydate, payment)
+        bond = construct_bond(paydate, payment, face_value)
         return bond
     
     
     payments = []
     paydates = []
     period = 1/freq
-    date = float(maturity)
-    while date > 0:
-        paydates.append(date)
-        date -= period
+    # Count whole periods back from maturity, repeated float subtraction drifts and can add a payment
+    # at a tiny positive time, rounding absorbs the error in maturity * freq itself
+    periods = math.ceil(round(maturity * freq, 10))
+    for k in range(periods):
+        paydates.append(float(maturity) - k * period)
 
     paydates.sort()
 
@@ -139,7 +142,7 @@ def construct_coupon_bond(maturity: float, face_value: float, rate: float, freq:
         payments.append(coupon)
 
     payments[-1] += face_value
-    bond = construct_bond(paydates, payments)
+    bond = construct_bond(paydates, payments, face_value)
     
     return bond
 
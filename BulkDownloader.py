@@ -0,0 +1,184 @@
+# Concurrent bulk price downloader
+# Fetches many tickers at once on a thread pool, with a concurrency cap, token-bucket rate limiting,
+# retries with exponential backoff and a report of the tickers that still failed
+
+import io
+import time
+import random
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+
+# Token bucket shared by all worker threads, rate tokens per second up to capacity
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Block until a token is available, then take it
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Provider reading <base_url>/<ticker>.csv over HTTP, with a Date column and one column per field
+# The date range is passed as query parameters and also applied locally, so a static file server works as a stub
+class HTTPCSVProvider:
+    def __init__(self, base_url, timeout=10.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def fetch(self, ticker, start_date, end_date, field='Close'):
+        query = urllib.parse.urlencode({'start': str(start_date), 'end': str(end_date), 'field': field})
+        url = self.base_url + '/' + urllib.parse.quote(ticker) + '.csv?' + query
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            data = pd.read_csv(io.BytesIO(response.read()), index_col='Date', parse_dates=True)
+        dates = data.index
+        return data.loc[(dates >= pd.Timestamp(start_date)) & (dates < pd.Timestamp(end_date)), field]
+
+# Client errors other than rate limiting will not succeed on a retry
+def retryable(error):
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code == 429
+    return not isinstance(error, (KeyError, ValueError, FileNotFoundError))
+
+class BulkDownloader:
+    def __init__(self, provider, concurrency=8, rate=None, burst=None, retries=3, backoff=0.5, max_backoff=8.0):
+        self.provider = provider
+        self.concurrency = concurrency
+        # rate limits requests per second across all threads, None for no limit
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = {}
+
+    # Call function() until it succeeds, waiting for a token before every attempt
+    def attempt(self, function):
+        for retry in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            try:
+                return function()
+            except Exception as error:
+                if retry == self.retries or not retryable(error):
+                    raise
+                # Exponential backoff with full jitter
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry)))
+
+    # Run {key: function} concurrently, returns ({key: result}, {key: error message}) for the failures
+    def run(self, tasks):
+        results = {}
+        failures = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {key: pool.submit(self.attempt, function) for key, function in tasks.items()}
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as error:
+                    failures[key] = repr(error)
+        self.failures = failures
+        return results, failures
+
+    # Prices for all tickers in [start_date, end_date), aligned on dates with one column per ticker
+    # Returns (prices, failures), tickers that failed after all retries are left out of the frame
+    def download(self, tickers, start_date, end_date, field='Close'):
+        tasks = {ticker: (lambda ticker=ticker: self.provider.fetch(ticker, start_date, end_date, field)) for ticker in tickers}
+        results, failures = self.run(tasks)
+        for ticker in failures:
+            print('Warning: failed to download ' + ticker + ': ' + failures[ticker])
+
+        columns = []
+        for ticker in tickers:
+            if ticker in results:
+                prices = results[ticker].rename(ticker)
+                index = pd.DatetimeIndex(prices.index)
+                if index.tz is not None:
+                    prices.index = index.tz_localize(None)
+                columns.append(prices)
+        # One alignment pass over all columns
+        prices = pd.concat(columns, axis=1) if columns else pd.DataFrame()
+        return prices, failures
+
+# End to end check against a local stub HTTP server, no network needed
+# The server answers <ticker>.csv slowly enough for requests to overlap and tracks the peak number in flight,
+# FLAKY fails with 500 twice, LIMITED is rate limited (429) once, DOWN always fails with 503 and MISSING is a 404
+# Checks the concurrency cap, that transient errors are retried until they succeed, that DOWN fails after
+# exactly retries + 1 requests and that MISSING fails without a retry; returns the checks and request counts
+def validate_bulk_downloader(tickers=24, concurrency=4, retries=3, delay=0.05):
+    state = {'in_flight': 0, 'peak': 0, 'requests': {}}
+    lock = threading.Lock()
+    scripted = {'FLAKY': [500, 500], 'LIMITED': [429], 'DOWN': [503] * (retries + 1), 'MISSING': [404] * (retries + 1)}
+    body = 'Date,Close\n2024-01-02,1.0\n2024-01-03,2.0\n2024-01-04,3.0\n'
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            ticker = urllib.parse.unquote(urllib.parse.urlparse(self.path).path.strip('/'))[:-len('.csv')]
+            with lock:
+                count = state['requests'].get(ticker, 0)
+                state['requests'][ticker] = count + 1
+                state['in_flight'] += 1
+                state['peak'] = max(state['peak'], state['in_flight'])
+            try:
+                time.sleep(delay)
+                errors = scripted.get(ticker, [])
+                if count < len(errors):
+                    self.send_error(errors[count])
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            finally:
+                with lock:
+                    state['in_flight'] -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        provider = HTTPCSVProvider('http://127.0.0.1:%d' % server.server_address[1])
+        downloader = BulkDownloader(provider, concurrency=concurrency, retries=retries, backoff=0.01, max_backoff=0.05)
+        names = ['T%d' % i for i in range(tickers)] + ['FLAKY', 'LIMITED', 'DOWN', 'MISSING']
+        start = time.perf_counter()
+        prices, failures = downloader.download(names, '2024-01-01', '2024-01-05')
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    requests = state['requests']
+    downloaded = [name for name in names if name in prices.columns]
+    checks = {
+        # Requests overlap up to the cap and never beyond it
+        'concurrency_cap': min(2, concurrency) <= state['peak'] <= concurrency,
+        'all_good_tickers': downloaded == names[:tickers] + ['FLAKY', 'LIMITED']
+                            and bool((prices.sum() == 6.0).all()) and len(prices) == 3,
+        'retried_until_success': requests.get('FLAKY') == 3 and requests.get('LIMITED') == 2,
+        'retries_exhausted': 'DOWN' in failures and requests.get('DOWN') == retries + 1,
+        'not_found_not_retried': 'MISSING' in failures and requests.get('MISSING') == 1,
+    }
+    for name, passed in checks.items():
+        print('%s: %s' % (name, 'ok' if passed else 'FAILED'))
+    print('peak in flight: %d of %d, requests: %d, seconds: %.3f' % (
+        state['peak'], concurrency, sum(requests.values()), elapsed))
+    return {'checks': checks, 'peak': state['peak'], 'requests': requests, 'failures': failures, 'seconds': elapsed}
@@ -0,0 +1,245 @@
+# Crank-Nicolson finite difference pricer for the Black-Scholes PDE
+# The PDE is solved in x = log(S), where its coefficients are constant:
+# V_tau = 1/2 sigma^2 V_xx + (r - 1/2 sigma^2) V_x - r V, stepping backwards from maturity in tau = T - t
+# Every time step is one tridiagonal solve, factorized once with LAPACK and reused for all steps and all
+# payoff columns, the first steps are Rannacher implicit half steps that damp the payoff kink
+# One solve gives prices, delta and gamma on the whole spot grid, and for plain options the whole strike
+# ladder too: prices are homogeneous, V(S, K) = K v(S / K), so one solve for K = 1 prices every strike
+
+import time
+import numpy as np
+from scipy.linalg import lapack
+from scipy.interpolate import CubicHermiteSpline
+from BlackScholes import batch_option_greeks
+
+EXERCISE = ('european', 'american')
+AMERICAN_METHODS = ('penalty', 'psor')
+# Grid half width in standard deviations of log(S) at maturity
+GRID_WIDTH = 6
+PENALTY = 1e8
+TOLERANCE = 1e-10
+MAX_ITERATIONS = 500
+
+# Tridiagonal system I - theta dt L on the interior nodes, L = lower V_(i-1) + middle V_i + upper V_(i+1)
+class ThetaSystem:
+    def __init__(self, lower, middle, upper, dt, theta, nodes):
+        self.dt = dt
+        self.theta = theta
+        self.lower = np.full(nodes - 1, -theta * dt * lower)
+        self.diagonal = np.full(nodes, 1 - theta * dt * middle)
+        self.upper = np.full(nodes - 1, -theta * dt * upper)
+        self.factor = lapack.dgttrf(self.lower, self.diagonal, self.upper)
+        if self.factor[-1] != 0:
+            raise ValueError('Warning: singular finite difference system')
+
+    # Solve for every column of rhs at once
+    def solve(self, rhs):
+        dl, d, du, du2, ipiv, info = self.factor
+        solution, info = lapack.dgttrs(dl, d, du, du2, ipiv, rhs)
+        return solution
+
+    # Linear complementarity problem min(A V - rhs, V - floor) = 0 of early exercise, by the penalty method:
+    # nodes below the floor get a large penalty pulling them onto it, repeated until the set of those nodes settles
+    def solve_penalty(self, rhs, floor):
+        solution = self.solve(rhs)
+        for column in range(rhs.shape[1]):
+            active = solution[:, column] < floor[:, column]
+            for _ in range(MAX_ITERATIONS):
+                if not active.any():
+                    break
+                penalty = PENALTY * active
+                _, _, _, x, info = lapack.dgtsv(self.lower, self.diagonal + penalty, self.upper,
+                                                (rhs[:, column] + penalty * floor[:, column])[:, np.newaxis])
+                solution[:, column] = x[:, 0]
+                updated = x[:, 0] < floor[:, column]
+                if np.array_equal(updated, active):
+                    break
+                active = updated
+        return solution
+
+    # The same problem by projected successive over-relaxation, red-black ordered so every half sweep
+    # is vectorized over the nodes of one colour and over all columns
+    def solve_psor(self, rhs, floor, start, relaxation=1.5):
+        solution = np.maximum(start, floor)
+        padded = np.zeros((len(solution) + 2, solution.shape[1]))
+        padded[1:-1] = solution
+        lower, diagonal, upper = self.lower[0], self.diagonal[0], self.upper[0]
+        for _ in range(MAX_ITERATIONS):
+            change = 0.0
+            for parity in (0, 1):
+                nodes = slice(parity + 1, len(padded) - 1, 2)
+                current = padded[nodes]
+                gauss_seidel = (rhs[parity::2] - lower * padded[parity:len(padded) - 2:2]
+                                - upper * padded[parity + 2::2][:len(current)]) / diagonal
+                updated = np.maximum(floor[parity::2], current + relaxation * (gauss_seidel - current))
+                change = max(change, np.max(np.abs(updated - current)))
+                padded[nodes] = updated
+            if change < TOLERANCE:
+                break
+        return padded[1:-1]
+
+# Delta and gamma with respect to S from central differences in x = log(S)
+def grid_greeks(spots, values, h):
+    first = np.gradient(values, h, axis=0)
+    second = np.empty_like(values)
+    second[1:-1] = (values[2:] - 2 * values[1:-1] + values[:-2]) / (h * h)
+    second[0], second[-1] = second[1], second[-2]
+    spots = spots[:, np.newaxis]
+    return first / spots, (second - first) / (spots * spots)
+
+# Solve the PDE for payoff columns on the spot grid of log(low)..log(high)
+# strike and sign (+1 call, -1 put) are arrays with one entry per column
+# A barrier at the low or high end knocks the option out for the rebate, otherwise the ends
+# follow the asymptotic values of the option
+# Returns the spots, and prices, delta and gamma with one column per payoff
+def crank_nicolson_grid(strike, sign, time_to_maturity, risk_free_rate, volatility, low, high,
+                        exercise='european', low_barrier=False, high_barrier=False, rebate=0.0,
+                        space_steps=400, time_steps=200, american_method='penalty', smoothing_steps=2):
+    if exercise not in EXERCISE:
+        raise ValueError('Warning: exercise must be one of ' + str(EXERCISE))
+    if american_method not in AMERICAN_METHODS:
+        raise ValueError('Warning: american method must be one of ' + str(AMERICAN_METHODS))
+    if not 0 < low < high:
+        raise ValueError('Warning: the spot grid needs 0 < low < high')
+    strike = np.asarray(strike, dtype=float).reshape(1, -1)
+    sign = np.asarray(sign, dtype=float).reshape(1, -1)
+    r, v = risk_free_rate, volatility
+
+    x = np.linspace(np.log(low), np.log(high), space_steps + 1)
+    h = x[1] - x[0]
+    spots = np.exp(x)
+    intrinsic = np.maximum(sign * (spots[:, np.newaxis] - strike), 0)
+    values = intrinsic.copy()
+    if low_barrier:
+        values[0] = rebate
+    if high_barrier:
+        values[-1] = rebate
+
+    # Constant coefficients of L in log space
+    diffusion = 0.5 * v * v / (h * h)
+    drift = (r - 0.5 * v * v) / (2 * h)
+    lower, middle, upper = diffusion - drift, -2 * diffusion - r, diffusion + drift
+
+    def boundary(tau, end, barrier):
+        if barrier:
+            return np.full(strike.shape[1], rebate)
+        value = np.maximum(sign[0] * (spots[end] - strike[0] * np.exp(-r * tau)), 0)
+        if exercise == 'american':
+            value = np.maximum(value, intrinsic[end])
+        return value
+
+    # Rannacher start: implicit Euler half steps, then Crank-Nicolson
+    dt = time_to_maturity / time_steps
+    smoothing_steps = min(smoothing_steps, time_steps)
+    implicit = ThetaSystem(lower, middle, upper, dt / 2, 1.0, space_steps - 1)
+    crank_nicolson = ThetaSystem(lower, middle, upper, dt, 0.5, space_steps - 1)
+    schedule = [implicit] * (2 * smoothing_steps) + [crank_nicolson] * (time_steps - smoothing_steps)
+
+    tau = 0.0
+    for system in schedule:
+        interior = values[1:-1]
+        rhs = interior.copy()
+        if system.theta < 1:
+            rhs += (1 - system.theta) * system.dt * (lower * values[:-2] + middle * interior + upper * values[2:])
+        tau += system.dt
+        low_value, high_value = boundary(tau, 0, low_barrier), boundary(tau, -1, high_barrier)
+        rhs[0] += system.theta * system.dt * lower * low_value
+        rhs[-1] += system.theta * system.dt * upper * high_value
+        if exercise == 'american' and american_method == 'penalty':
+            interior = system.solve_penalty(rhs, intrinsic[1:-1])
+        elif exercise == 'american':
+            interior = system.solve_psor(rhs, intrinsic[1:-1], interior)
+        else:
+            interior = system.solve(rhs)
+        values = np.vstack((low_value, interior, high_value))
+
+    delta, gamma = grid_greeks(spots, values, h)
+    return spots, values, delta, gamma
+
+# Prices, delta and gamma of options with one expiry, stock_price, strike_price and call broadcast against each other
+# Without barriers a single solve for strike 1 on a moneyness grid prices the whole chain, V(S, K) = K v(S / K)
+# With a knock-out lower_barrier and / or upper_barrier (rebate paid on the hit) the grid runs between the
+# barriers and every distinct strike is one column of the same solves
+# Prices and deltas are interpolated at the requested spots by cubic Hermite splines through the grid's
+# own derivatives, gamma linearly, spots at or beyond a barrier are already knocked out and get the rebate
+# with zero delta and gamma
+def finite_difference_pricer(stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, call=True,
+                             exercise='european', lower_barrier=None, upper_barrier=None, rebate=0.0,
+                             space_steps=400, time_steps=200, american_method='penalty'):
+    s, k, call = np.broadcast_arrays(np.asarray(stock_price, dtype=float), np.asarray(strike_price, dtype=float),
+                                     np.asarray(call, dtype=bool))
+    shape = s.shape
+    s, k, call = s.ravel(), k.ravel(), call.ravel()
+    width = GRID_WIDTH * volatility * np.sqrt(time_to_maturity)
+    signs = np.where(call, 1.0, -1.0)
+
+    if lower_barrier is None and upper_barrier is None:
+        # One column per option type on the moneyness grid
+        types, column = np.unique(signs, return_inverse=True)
+        moneyness = s / k
+        low = min(np.exp(-width), moneyness.min() * np.exp(-0.5 * width))
+        high = max(np.exp(width), moneyness.max() * np.exp(0.5 * width))
+        spots, values, delta, gamma = crank_nicolson_grid(np.ones(len(types)), types, time_to_maturity, risk_free_rate,
+                                                          volatility, low, high, exercise, space_steps=space_steps,
+                                                          time_steps=time_steps, american_method=american_method)
+        points, scale = moneyness, k
+    else:
+        # One column per distinct strike and option type
+        pairs, column = np.unique(np.column_stack((k, signs)), axis=0, return_inverse=True)
+        low = lower_barrier if lower_barrier is not None else min(s.min(), k.min()) * np.exp(-width)
+        high = upper_barrier if upper_barrier is not None else max(s.max(), k.max()) * np.exp(width)
+        spots, values, delta, gamma = crank_nicolson_grid(pairs[:, 0], pairs[:, 1], time_to_maturity, risk_free_rate,
+                                                          volatility, low, high, exercise, lower_barrier is not None,
+                                                          upper_barrier is not None, rebate, space_steps, time_steps,
+                                                          american_method)
+        points, scale = s, np.ones(len(s))
+    column = column.ravel()
+    knocked_out = np.zeros(len(s), dtype=bool)
+    if lower_barrier is not None:
+        knocked_out |= s <= lower_barrier
+    if upper_barrier is not None:
+        knocked_out |= s >= upper_barrier
+
+    price, option_delta, option_gamma = np.full(len(s), float(rebate)), np.zeros(len(s)), np.zeros(len(s))
+    for j in np.unique(column[~knocked_out]):
+        rows = (column == j) & ~knocked_out
+        inside = np.clip(points[rows], spots[0], spots[-1])
+        price[rows] = CubicHermiteSpline(spots, values[:, j], delta[:, j])(inside) * scale[rows]
+        option_delta[rows] = CubicHermiteSpline(spots, delta[:, j], gamma[:, j])(inside)
+        option_gamma[rows] = np.interp(inside, spots, gamma[:, j]) / scale[rows]
+
+    if len(shape) == 0:
+        return {'price': float(price[0]), 'delta': float(option_delta[0]), 'gamma': float(option_gamma[0])}
+    return {'price': price.reshape(shape), 'delta': option_delta.reshape(shape), 'gamma': option_gamma.reshape(shape)}
+
+# Largest errors of a whole strike ladder priced by one solve against Black-Scholes prices and Greeks,
+# and of a down-and-out call against its closed form
+def validate_against_black_scholes(space_steps=400, time_steps=200, spot=100.0, time_to_maturity=1.0,
+                                   risk_free_rate=0.05, volatility=0.25):
+    strikes = np.linspace(60, 140, 81)
+    start = time.perf_counter()
+    result = finite_difference_pricer(spot, strikes, time_to_maturity, risk_free_rate, volatility,
+                                      space_steps=space_steps, time_steps=time_steps)
+    elapsed = time.perf_counter() - start
+    exact = batch_option_greeks(spot, strikes, time_to_maturity, risk_free_rate, volatility)
+    report = {'seconds': elapsed,
+              'price_error': np.max(np.abs(result['price'] - exact['call_price'])),
+              'delta_error': np.max(np.abs(result['delta'] - exact['call_delta'])),
+              'gamma_error': np.max(np.abs(result['gamma'] - exact['gamma']))}
+
+    # Down-and-out call with the barrier below the strike:
+    # C(S) - (B / S)^(2 r / sigma^2 - 1) C(B^2 / S)
+    barrier = 0.8 * spot
+    strike = np.array([90.0, 100.0, 110.0])
+    knock_out = finite_difference_pricer(spot, strike, time_to_maturity, risk_free_rate, volatility,
+                                         lower_barrier=barrier, space_steps=space_steps, time_steps=time_steps)
+    power = 2 * risk_free_rate / volatility ** 2 - 1
+    mirror = batch_option_greeks(barrier * barrier / spot, strike, time_to_maturity, risk_free_rate, volatility)
+    closed_form = batch_option_greeks(spot, strike, time_to_maturity, risk_free_rate, volatility)['call_price'] \
+        - (barrier / spot) ** power * mirror['call_price']
+    report['barrier_error'] = np.max(np.abs(knock_out['price'] - closed_form))
+
+    print('strikes: %d, seconds: %.4f' % (len(strikes), elapsed))
+    print('max errors, price: %.2e, delta: %.2e, gamma: %.2e, down-and-out: %.2e' % (
+        report['price_error'], report['delta_error'], report['gamma_error'], report['barrier_error']))
+    return report
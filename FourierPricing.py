@@ -0,0 +1,198 @@
+# Characteristic function pricing of European options under Heston, Merton jump-diffusion and Variance Gamma
+# A whole strike grid of one expiry is priced at once, by the Carr-Madan FFT in O(N log N) or by the COS method
+# (a cosine expansion, one (terms x strikes) matrix product), and calibrate fits a model to a quoted surface
+# with every residual evaluation pricing all quotes, one vectorized pass per expiry
+
+import time
+import numpy as np
+import pandas as pd
+from scipy import optimize
+from scipy.interpolate import CubicSpline
+from BlackScholes import batch_option_pricer
+
+# Characteristic functions E[exp(i u X)] of the risk-neutral log return X = log(S_T / S_0)
+
+def black_scholes_characteristic(u, t, r, volatility):
+    return np.exp(1j * u * (r - 0.5 * volatility ** 2) * t - 0.5 * volatility ** 2 * u * u * t)
+
+# Heston, in the formulation of Albrecher et al. that avoids the branch cut of the complex logarithm
+def heston_characteristic(u, t, r, v0, kappa, theta, sigma, rho):
+    beta = kappa - 1j * rho * sigma * u
+    d = np.sqrt(beta * beta + sigma * sigma * (1j * u + u * u))
+    g = (beta - d) / (beta + d)
+    decay = np.exp(-d * t)
+    c = kappa * theta / sigma ** 2 * ((beta - d) * t - 2 * np.log((1 - g * decay) / (1 - g)))
+    d_term = (beta - d) / sigma ** 2 * (1 - decay) / (1 - g * decay)
+    return np.exp(1j * u * r * t + c + d_term * v0)
+
+# Merton jump-diffusion, normal log jumps with mean mu and deviation delta arriving at rate lam
+def merton_characteristic(u, t, r, volatility, lam, mu, delta):
+    compensator = lam * (np.exp(mu + 0.5 * delta ** 2) - 1)
+    jumps = lam * t * (np.exp(1j * u * mu - 0.5 * delta ** 2 * u * u) - 1)
+    return np.exp(1j * u * (r - compensator - 0.5 * volatility ** 2) * t - 0.5 * volatility ** 2 * u * u * t + jumps)
+
+# Variance Gamma, Brownian motion with drift theta and volatility sigma run on a gamma clock of variance rate nu
+def variance_gamma_characteristic(u, t, r, sigma, nu, theta):
+    omega = np.log(1 - theta * nu - 0.5 * sigma ** 2 * nu) / nu
+    return np.exp(1j * u * (r + omega) * t) * (1 - 1j * u * theta * nu + 0.5 * sigma ** 2 * nu * u * u) ** (-t / nu)
+
+# Characteristic function and parameter names of every model
+MODELS = {
+    'black-scholes': (black_scholes_characteristic, ('volatility',)),
+    'heston': (heston_characteristic, ('v0', 'kappa', 'theta', 'sigma', 'rho')),
+    'merton': (merton_characteristic, ('volatility', 'lam', 'mu', 'delta')),
+    'variance-gamma': (variance_gamma_characteristic, ('sigma', 'nu', 'theta')),
+}
+METHODS = ('cos', 'fft')
+
+def characteristic_function(model):
+    if model not in MODELS:
+        raise ValueError('Warning: model must be one of ' + str(list(MODELS)))
+    return MODELS[model][0]
+
+# Carr-Madan: the damped call price exp(alpha k) C(k) is integrable in the log strike k, and its Fourier transform
+# is known in closed form from the characteristic function, so one FFT gives calls on N log strikes,
+# which are then interpolated at the requested strikes
+def carr_madan_calls(stock_price, strikes, t, r, model, parameters, points=4096, spacing=0.25, alpha=1.5):
+    phi = characteristic_function(model)
+    v = spacing * np.arange(points)
+    # Log strike spacing and the lowest log strike, the grid is centred on the spot
+    step = 2 * np.pi / (points * spacing)
+    lowest = np.log(stock_price) - points * step / 2
+
+    u = v - (alpha + 1) * 1j
+    transform = np.exp(-r * t) * phi(u, t, r, *parameters) * np.exp(1j * u * np.log(stock_price))
+    transform /= alpha * alpha + alpha - v * v + 1j * (2 * alpha + 1) * v
+    # Simpson weights
+    weights = np.full(points, 2.0)
+    weights[1::2] = 4.0
+    weights[0] = 1.0
+    weights *= spacing / 3
+    values = np.fft.fft(np.exp(-1j * v * lowest) * transform * weights).real
+
+    log_strikes = lowest + step * np.arange(points)
+    calls = np.exp(-alpha * log_strikes) / np.pi * values
+    return CubicSpline(log_strikes, calls)(np.log(strikes))
+
+# COS method of Fang and Oosterlee: the density of log(S_T / K) is expanded in cosines on [a, b],
+# where the put payoff coefficients are known in closed form, calls follow from put-call parity
+# The truncation range comes from the first two cumulants, taken numerically from the characteristic function
+def cos_puts(stock_price, strikes, t, r, model, parameters, terms=256, width=12):
+    phi = characteristic_function(model)
+    strikes = np.asarray(strikes, dtype=float)
+    h = 1e-4
+    log_phi = np.log(phi(np.array([-h, 0.0, h]), t, r, *parameters))
+    mean = ((log_phi[2] - log_phi[0]) / (2j * h)).real
+    variance = -((log_phi[2] - 2 * log_phi[1] + log_phi[0]) / (h * h)).real
+    a, b = mean - width * np.sqrt(variance), mean + width * np.sqrt(variance)
+
+    # Moneyness log(S / K), the expansion runs in y = log(S_T / K) = x + X
+    x = np.log(stock_price / strikes)
+    lower, upper = a + x.min(), b + x.max()
+    k = np.arange(terms)
+    frequency = k * np.pi / (upper - lower)
+    # Put payoff K (1 - e^y)^+ on [lower, 0]
+    chi = (np.cos(frequency * (0 - lower)) - np.exp(lower) + frequency * np.sin(frequency * (0 - lower))) \
+        / (1 + frequency * frequency)
+    psi = np.empty(terms)
+    psi[0] = -lower
+    psi[1:] = np.sin(frequency[1:] * (0 - lower)) / frequency[1:]
+    coefficients = 2 / (upper - lower) * (psi - chi)
+    coefficients[0] *= 0.5
+
+    # One (strikes x terms) matrix of expansion terms
+    terms_matrix = phi(frequency, t, r, *parameters)[np.newaxis, :] * np.exp(1j * frequency[np.newaxis, :] * (x[:, np.newaxis] - lower))
+    return strikes * np.exp(-r * t) * (terms_matrix.real @ coefficients)
+
+# Call and put prices for a grid of strikes with one expiry, a pair of floats for a scalar strike
+def fourier_option_pricer(stock_price, strikes, time_to_maturity, risk_free_rate, model, parameters, method='cos'):
+    if method not in METHODS:
+        raise ValueError('Warning: method must be one of ' + str(METHODS))
+    strikes = np.asarray(strikes, dtype=float)
+    discounted_strikes = strikes * np.exp(-risk_free_rate * time_to_maturity)
+    if method == 'cos':
+        put = cos_puts(stock_price, strikes.ravel(), time_to_maturity, risk_free_rate, model, parameters).reshape(strikes.shape)
+        call = put + stock_price - discounted_strikes
+    else:
+        call = carr_madan_calls(stock_price, strikes, time_to_maturity, risk_free_rate, model, parameters)
+        put = call - stock_price + discounted_strikes
+    if strikes.ndim == 0:
+        return float(call), float(put)
+    return call, put
+
+# Prices of a whole surface of quotes, one strike grid pricing per distinct expiry
+def surface_prices(stock_price, strikes, expiries, calls, risk_free_rate, model, parameters, method='cos'):
+    prices = np.empty(len(strikes))
+    for expiry in np.unique(expiries):
+        rows = expiries == expiry
+        call, put = fourier_option_pricer(stock_price, strikes[rows], expiry, risk_free_rate, model, parameters, method)
+        prices[rows] = np.where(calls[rows], call, put)
+    return prices
+
+# Least squares fit of a model's parameters to quoted prices
+# quotes is a DataFrame with strike_price, time_to_maturity, price and optionally call (default all calls)
+# and weight columns, bounds is (lower, upper) per parameter in the order of MODELS[model][1]
+# Returns the fitted parameters by name and a report with the RMSE, the number of pricing passes and the time
+def calibrate(quotes, stock_price, risk_free_rate, model, initial, bounds=None, method='cos'):
+    characteristic_function(model)
+    names = MODELS[model][1]
+    missing = [c for c in ('strike_price', 'time_to_maturity', 'price') if c not in quotes.columns]
+    if len(missing) > 0:
+        raise ValueError('Warning: quotes are missing columns ' + str(missing))
+    strikes = quotes['strike_price'].to_numpy(dtype=float)
+    expiries = quotes['time_to_maturity'].to_numpy(dtype=float)
+    prices = quotes['price'].to_numpy(dtype=float)
+    calls = quotes['call'].to_numpy(dtype=bool) if 'call' in quotes.columns else np.ones(len(prices), dtype=bool)
+    weights = quotes['weight'].to_numpy(dtype=float) if 'weight' in quotes.columns else np.ones(len(prices))
+
+    passes = [0]
+
+    def residuals(parameters):
+        passes[0] += 1
+        with np.errstate(all='ignore'):
+            model_prices = surface_prices(stock_price, strikes, expiries, calls, risk_free_rate, model, parameters, method)
+        # Parameters where the characteristic function breaks down are pushed away
+        return np.nan_to_num(weights * (model_prices - prices), nan=1e6, posinf=1e6, neginf=-1e6)
+
+    start = time.perf_counter()
+    if bounds is None:
+        bounds = (-np.inf, np.inf)
+    fit = optimize.least_squares(residuals, np.asarray(initial, dtype=float), bounds=bounds, x_scale='jac')
+    elapsed = time.perf_counter() - start
+    report = {'rmse': np.sqrt(np.mean(fit.fun ** 2)), 'evaluations': passes[0], 'seconds': elapsed,
+              'success': fit.success, 'message': fit.message}
+    return {name: float(value) for name, value in zip(names, fit.x)}, report
+
+# Checks the pricers against Black-Scholes and against each other, then recovers Heston parameters
+# from a synthetic surface of quotes
+def benchmark_fourier_pricing(stock_price=100.0, risk_free_rate=0.03, seed=0):
+    strikes = np.linspace(60, 160, 201)
+    exact_call, exact_put = batch_option_pricer(stock_price, strikes, 1.0, risk_free_rate, 0.2)
+    for method in METHODS:
+        call, put = fourier_option_pricer(stock_price, strikes, 1.0, risk_free_rate, 'black-scholes', (0.2,), method)
+        error = max(np.max(np.abs(call - exact_call)), np.max(np.abs(put - exact_put)))
+        print('%s vs Black-Scholes, max error: %.2e' % (method, error))
+
+    examples = {'heston': (0.04, 1.5, 0.05, 0.6, -0.7), 'merton': (0.15, 0.5, -0.1, 0.15),
+                'variance-gamma': (0.2, 0.2, -0.15)}
+    for model, parameters in examples.items():
+        cos_call, _ = fourier_option_pricer(stock_price, strikes, 1.0, risk_free_rate, model, parameters, 'cos')
+        fft_call, _ = fourier_option_pricer(stock_price, strikes, 1.0, risk_free_rate, model, parameters, 'fft')
+        print('%s, cos vs fft max difference: %.2e' % (model, np.max(np.abs(cos_call - fft_call))))
+
+    # Synthetic Heston surface, 20 expiries of 100 strikes with a little noise
+    rng = np.random.default_rng(seed)
+    true = examples['heston']
+    expiries = np.repeat(np.linspace(0.1, 3.0, 20), 100)
+    quote_strikes = np.tile(np.linspace(70, 140, 100), 20)
+    calls = quote_strikes >= stock_price
+    prices = surface_prices(stock_price, quote_strikes, expiries, calls, risk_free_rate, 'heston', true)
+    quotes = pd.DataFrame({'strike_price': quote_strikes, 'time_to_maturity': expiries,
+                           'price': prices + rng.normal(0, 0.01, len(prices)), 'call': calls})
+    fitted, report = calibrate(quotes, stock_price, risk_free_rate, 'heston', (0.02, 1.0, 0.02, 0.3, -0.3),
+                               bounds=([1e-4, 1e-2, 1e-4, 1e-2, -0.99], [1.0, 10.0, 1.0, 2.0, 0.99]))
+    print('heston calibration to %d quotes: %.2f seconds, %d pricing passes, rmse %.4f' % (
+        len(quotes), report['seconds'], report['evaluations'], report['rmse']))
+    print('true: ' + str(dict(zip(MODELS['heston'][1], true))))
+    print('fitted: ' + str({name: round(value, 4) for name, value in fitted.items()}))
+    return fitted, report
@@ -0,0 +1,136 @@
+# Implied volatility solver
+# Backs out Black-Scholes volatilities for whole arrays of quotes at once
+
+import time
+import numpy as np
+from scipy import special
+from BlackScholes import broadcast_inputs, probability_factors, batch_option_pricer, batch_option_greeks
+
+MIN_VOLATILITY = 1e-6
+MAX_VOLATILITY = 10.0
+TOLERANCE = 1e-12
+MAX_ITERATIONS = 50
+
+# Black-Scholes price, vega and volga for calls (w = 1) and puts (w = -1)
+def price_vega_volga(s, k, t, r, v, w):
+    d1, d2, _ = probability_factors(s, k, t, r, v)
+    discounted_strike = k * np.exp(-r * t)
+    price = w * (s * special.ndtr(w * d1) - discounted_strike * special.ndtr(w * d2))
+    vega = s * np.sqrt(t) * np.exp(-0.5 * d1 * d1) / np.sqrt(2 * np.pi)
+    volga = vega * d1 * d2 / v
+    return price, vega, volga
+
+# Rational initial guess (Corrado-Miller) with Brenner-Subrahmanyam as fallback
+def initial_guess(price, s, k, t, r, w):
+    discounted_strike = k * np.exp(-r * t)
+    # Work with the call-equivalent price through put-call parity
+    call = np.where(w > 0, price, price + s - discounted_strike)
+    scale = np.sqrt(2 * np.pi / t) / (s + discounted_strike)
+    a = call - 0.5 * (s - discounted_strike)
+    discriminant = a * a - (s - discounted_strike) ** 2 / np.pi
+    guess = scale * (a + np.sqrt(np.maximum(discriminant, 0)))
+    brenner = np.sqrt(2 * np.pi / t) * call / s
+    guess = np.where((discriminant > 0) & (guess > MIN_VOLATILITY), guess, brenner)
+    return np.clip(guess, 0.01, 2.0)
+
+# Vectorized implied volatility for market prices and contract terms
+# call may be a boolean or a boolean array, quotes outside arbitrage bounds return NaN
+# Scalar inputs return a float (and an int iteration count with full_output)
+# Safeguarded Halley iterations on a shrinking [low, high] bracket, bisecting when a step leaves it
+# Converged contracts are masked out, so each iteration only touches the remaining quotes
+def implied_volatility(market_price, stock_price, strike_price, time_to_maturity, risk_free_rate, call=True,
+                       tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS, full_output=False):
+    p, s, k, t, r = broadcast_inputs(market_price, stock_price, strike_price, time_to_maturity, risk_free_rate)
+    call = np.asarray(call, dtype=bool)
+    shape = np.broadcast_shapes(p.shape, call.shape)
+    w = np.where(np.broadcast_to(call, shape), 1.0, -1.0).ravel()
+    p, s, k, t, r = (np.broadcast_to(a, shape).ravel() for a in (p, s, k, t, r))
+
+    discounted_strike = k * np.exp(-r * t)
+    intrinsic = np.maximum(w * (s - discounted_strike), 0)
+    upper = np.where(w > 0, s, discounted_strike)
+    valid = (p > intrinsic) & (p < upper) & (t > 0)
+
+    vol = np.full(p.shape, np.nan)
+    iterations = np.zeros(p.shape, dtype=np.int64)
+    active = np.flatnonzero(valid)
+    sigma = initial_guess(p[active], s[active], k[active], t[active], r[active], w[active])
+    low = np.full(active.shape, MIN_VOLATILITY)
+    high = np.full(active.shape, MAX_VOLATILITY)
+
+    for i in range(max_iterations):
+        if active.size == 0:
+            break
+        price, vega, volga = price_vega_volga(s[active], k[active], t[active], r[active], sigma, w[active])
+        diff = price - p[active]
+        iterations[active] += 1
+
+        # Price is increasing in volatility, so the sign of diff tightens the bracket
+        high = np.where(diff > 0, sigma, high)
+        low = np.where(diff <= 0, sigma, low)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton = diff / vega
+            step = newton / (1 - 0.5 * newton * volga / vega)
+            step = np.where(np.abs(step) > np.abs(2 * newton), newton, step)
+        update = sigma - step
+        # Fall back to bisection (in log-volatility) when either the Newton or the Halley step leaves the bracket
+        outside = ~np.isfinite(update) | (update <= low) | (update >= high) \
+            | ~np.isfinite(newton) | (sigma - newton <= low) | (sigma - newton >= high)
+        update = np.where(outside, np.sqrt(low * high), update)
+
+        done = (np.abs(diff) <= tolerance * np.maximum(p[active], 1.0)) | (np.abs(update - sigma) <= tolerance * sigma)
+        vol[active[done]] = np.where(np.abs(diff[done]) <= tolerance * np.maximum(p[active[done]], 1.0), sigma[done], update[done])
+
+        keep = ~done
+        active = active[keep]
+        sigma = update[keep]
+        low = low[keep]
+        high = high[keep]
+
+    # Whatever did not converge keeps its last iterate
+    vol[active] = sigma
+    if len(shape) == 0:
+        if full_output:
+            return float(vol[0]), int(iterations[0])
+        return float(vol[0])
+    vol = vol.reshape(shape)
+    if full_output:
+        return vol, iterations.reshape(vol.shape)
+    return vol
+
+# Throughput benchmark (IVs per second) and round-trip accuracy report against the batch pricer
+def benchmark_implied_volatility(contracts=100000, repeats=5, seed=0):
+    rng = np.random.default_rng(seed)
+    s = np.full(contracts, 100.0)
+    k = s * np.exp(rng.uniform(-0.5, 0.5, contracts))
+    t = rng.uniform(0.05, 3.0, contracts)
+    r = rng.uniform(0.0, 0.06, contracts)
+    v = rng.uniform(0.05, 1.0, contracts)
+    call = rng.random(contracts) < 0.5
+    greeks = batch_option_greeks(s, k, t, r, v)
+    price = np.where(call, greeks['call_price'], greeks['put_price'])
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vol, iterations = implied_volatility(price, s, k, t, r, call, full_output=True)
+        timings.append(time.perf_counter() - start)
+
+    round_call, round_put = batch_option_pricer(s, k, t, r, vol)
+    round_price = np.where(call, round_call, round_put)
+    solved = np.isfinite(vol)
+    # Quotes with (numerically) zero vega carry no volatility information
+    identifiable = solved & (greeks['vega'] > 1e-4)
+    report = {
+        'contracts': contracts,
+        'ivs_per_second': contracts / min(timings),
+        'solved_fraction': solved.mean(),
+        'mean_iterations': iterations[solved].mean(),
+        'max_iterations': iterations.max(),
+        'max_vol_error': np.max(np.abs(vol[identifiable] - v[identifiable])),
+        'max_price_error': np.max(np.abs(round_price[solved] - price[solved])),
+    }
+    for key, value in report.items():
+        print(key + ': ' + str(value))
+    return report
@@ -0,0 +1,176 @@
+# Market data layer
+# Prices are cached on disk as one memory-mapped NumPy file per ticker and field,
+# and an index of the date ranges already fetched means only missing ranges hit the provider
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+try:
+    import yfinance as yf
+except ImportError:
+    yf = None
+
+PRICE_DTYPE = np.dtype([('date', 'datetime64[D]'), ('price', 'float64')])
+INDEX_FILE = 'index.json'
+
+# Yahoo Finance provider
+# fetch returns the prices of one ticker for dates in [start_date, end_date) as a Series indexed by date
+class YahooProvider:
+    def fetch(self, ticker, start_date, end_date, field='Close'):
+        if yf is None:
+            raise ImportError('Warning: yfinance is required for the Yahoo provider')
+        if field == 'Adj Close':
+            prices = yf.download(ticker, start_date, end_date, auto_adjust=False, progress=False)['Adj Close']
+        else:
+            prices = yf.Ticker(ticker).history(start=start_date, end=end_date)[field]
+        if isinstance(prices, pd.DataFrame):
+            prices = prices.iloc[:, 0]
+        return prices
+
+# Local stand-in provider, reads <directory>/<ticker>.csv with a Date column and one column per field
+class CSVProvider:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, ticker, start_date, end_date, field='Close'):
+        data = pd.read_csv(os.path.join(self.directory, ticker + '.csv'), index_col='Date', parse_dates=True)
+        dates = data.index
+        return data.loc[(dates >= pd.Timestamp(start_date)) & (dates < pd.Timestamp(end_date)), field]
+
+# Calendar day of a date-like value
+def to_day(date):
+    return np.datetime64(pd.Timestamp(date).date(), 'D')
+
+# Sorted, merged list of [start, end) day ranges
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+# Parts of [start, end) not covered by the given merged ranges
+def missing_ranges(covered, start, end):
+    missing = []
+    for covered_start, covered_end in covered:
+        if covered_end <= start or covered_start >= end:
+            continue
+        if covered_start > start:
+            missing.append([start, covered_start])
+        start = max(start, covered_end)
+    if start < end:
+        missing.append([start, end])
+    return missing
+
+class MarketDataCache:
+    def __init__(self, directory, provider=None):
+        self.directory = directory
+        self.provider = provider if provider is not None else YahooProvider()
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, INDEX_FILE)
+        # Covered ranges per ticker and field, as ISO date strings
+        self.index = {}
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+
+    def key(self, ticker, field):
+        return ticker + '|' + field
+
+    def path(self, ticker, field):
+        name = (ticker + '_' + field).replace(os.sep, '_').replace(' ', '_')
+        return os.path.join(self.directory, name + '.npy')
+
+    def covered(self, ticker, field):
+        return [[np.datetime64(s, 'D'), np.datetime64(e, 'D')] for s, e in self.index.get(self.key(ticker, field), [])]
+
+    # Prices already on disk, memory-mapped unless mmap_mode is None
+    def stored(self, ticker, field, mmap_mode='r'):
+        path = self.path(ticker, field)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=PRICE_DTYPE)
+        return np.load(path, mmap_mode=mmap_mode)
+
+    # Fetch the missing date ranges of one ticker from the provider
+    # Returns the fetched prices and the ranges they cover
+    # Today is fetched but never recorded as covered, its session may still be open, so later calls
+    # fetch it again and the newer prices replace the intraday ones; days after today have no prices yet
+    def fetch_missing(self, ticker, start_date, end_date, field='Close'):
+        start = to_day(start_date)
+        today = to_day(pd.Timestamp.today())
+        end = min(to_day(end_date), today + 1)
+        fetched = []
+        ranges = []
+        for range_start, range_end in missing_ranges(self.covered(ticker, field), start, end):
+            fetched.append(self.provider.fetch(ticker, str(range_start), str(range_end), field))
+            if range_start < today:
+                ranges.append([range_start, min(range_end, today)])
+        return fetched, ranges
+
+    # Merge fetched prices into the on-disk table and record the covered ranges
+    def store(self, ticker, field, fetched, ranges):
+        if len(fetched) == 0:
+            return
+        # Read fully into memory, Windows refuses to replace a file that is still mapped
+        rows = [self.stored(ticker, field, mmap_mode=None)]
+        for prices in fetched:
+            index = pd.DatetimeIndex(prices.index)
+            if index.tz is not None:
+                index = index.tz_localize(None)
+            block = np.empty(len(prices), dtype=PRICE_DTYPE)
+            block['date'] = index.normalize().values.astype('datetime64[D]')
+            block['price'] = np.asarray(prices, dtype=float)
+            rows.append(block)
+        table = np.concatenate(rows)
+        # Keep the latest value for each date, in date order
+        _, last = np.unique(table['date'][::-1], return_index=True)
+        table = table[len(table) - 1 - last]
+
+        # Write then rename, so readers never see a partial file
+        path = self.path(ticker, field)
+        np.save(path + '.tmp.npy', table)
+        os.replace(path + '.tmp.npy', path)
+
+        key = self.key(ticker, field)
+        covered = merge_ranges(self.covered(ticker, field) + ranges)
+        self.index[key] = [[str(s), str(e)] for s, e in covered]
+        self.save_index()
+
+    def save_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(self.index, f)
+        os.replace(index_path + '.tmp', index_path)
+
+    # Prices of one ticker for dates in [start_date, end_date), fetching only what is not cached
+    def load_ticker(self, ticker, start_date, end_date, field='Close'):
+        fetched, ranges = self.fetch_missing(ticker, start_date, end_date, field)
+        self.store(ticker, field, fetched, ranges)
+        return self.read(ticker, start_date, end_date, field)
+
+    # Cached prices of one ticker for dates in [start_date, end_date), without fetching
+    def read(self, ticker, start_date, end_date, field='Close'):
+        table = self.stored(ticker, field)
+        lower, upper = np.searchsorted(table['date'], [to_day(start_date), to_day(end_date)])
+        # Copied out of the mapping, so a returned Series never keeps the file mapped for a later store
+        rows = np.array(table[lower:upper])
+        return pd.Series(rows['price'], index=pd.DatetimeIndex(rows['date'].astype('datetime64[ns]'), name='Date'), name=ticker)
+
+    # Prices of many tickers aligned on dates, one column per ticker
+    # With a BulkDownloader.BulkDownloader the missing ranges of all tickers are fetched concurrently,
+    # tickers that still fail are reported in downloader.failures and served from whatever is cached
+    def load(self, tickers, start_date, end_date, field='Close', downloader=None):
+        if downloader is not None:
+            tasks = {ticker: (lambda ticker=ticker: self.fetch_missing(ticker, start_date, end_date, field)) for ticker in tickers}
+            results, failures = downloader.run(tasks)
+            for ticker in failures:
+                print('Warning: failed to download ' + ticker + ': ' + failures[ticker])
+            # The index is written from this thread only
+            for ticker, (fetched, ranges) in results.items():
+                self.store(ticker, field, fetched, ranges)
+            return pd.DataFrame({ticker: self.read(ticker, start_date, end_date, field) for ticker in tickers})
+        return pd.DataFrame({ticker: self.load_ticker(ticker, start_date, end_date, field) for ticker in tickers})
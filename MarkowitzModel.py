@@ -8,7 +8,13 @@ TRADING_DAYS = 252
 PORTFOLIOS = 100000
 
 # Download yfinance data for selected stocks, from start_date - end_date
-def download_data(start_date, end_date, stocks):
+# With a MarketData.MarketDataCache only the date ranges missing from disk are downloaded,
+# with a BulkDownloader.BulkDownloader the tickers are fetched concurrently
+def download_data(start_date, end_date, stocks, cache=None, downloader=None):
+    if cache is not None:
+        return cache.load(stocks, start_date, end_date, 'Close', downloader)
+    if downloader is not None:
+        return downloader.download(stocks, start_date, end_date, 'Close')[0]
     close_data = {}
     for s in stocks:
         ticker = yf.Ticker(s)
@@ -34,22 +40,26 @@ def compute_mean_variance(returns, weights):
     print('Expected portfolio mean: '+ str(ret))
     print('Expected portfolio volatility: '+ str(vol))
 
+# Annualized mean vector and covariance matrix of returns, computed once and shared
+def annual_statistics(returns):
+    return returns.mean().to_numpy() * TRADING_DAYS, returns.cov().to_numpy() * TRADING_DAYS
+
 # Generate random portfolios
-def generate_portfolios(returns, stocks):
-    means = []
-    risks = []
-    weights = []
-
-    for _ in range(PORTFOLIOS):
-        weight = np.random.random(len(stocks))
-        weight /= np.sum(weight)
-        mean = np.sum(returns.mean() * weight) * TRADING_DAYS
-        risk = np.sqrt(np.dot(weight.T, np.dot(returns.cov() * TRADING_DAYS, weight)))
-        weights.append(weight)
-        means.append(mean)
-        risks.append(risk)
-
-    return np.array(weights), np.array(means), np.array(risks)
+# Weights are drawn as one matrix and scored in chunks against the precomputed mean and covariance
+def generate_portfolios(returns, stocks, portfolios=PORTFOLIOS, chunk_size=10000, seed=None):
+    mean, cov = annual_statistics(returns)
+    rng = np.random.default_rng(seed)
+    weights = rng.random((portfolios, len(stocks)))
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    means = weights @ mean
+    risks = np.empty(portfolios)
+    for start in range(0, portfolios, chunk_size):
+        chunk = weights[start:start + chunk_size]
+        # Row-wise w^T C w without forming the portfolios x portfolios product
+        risks[start:start + chunk_size] = np.sqrt(np.einsum('ij,ij->i', chunk @ cov, chunk))
+
+    return weights, means, risks
 
 # Portfolio statistics, containing returns, volatility and sharpe ratio
 def portfolio_statistics(weights, returns):
@@ -60,16 +70,60 @@ def portfolio_statistics(weights, returns):
 def minimize_sharpe_ratio(weights, returns):
     return -portfolio_statistics(weights, returns)[2]
 
+# Negative Sharpe ratio and its analytic gradient from precomputed annual mean and covariance
+def negative_sharpe_ratio(weights, mean, cov):
+    ret = weights @ mean
+    cov_weights = cov @ weights
+    vol = np.sqrt(weights @ cov_weights)
+    sharpe = ret / vol
+    gradient = -(mean / vol - sharpe * cov_weights / (vol * vol))
+    return -sharpe, gradient
+
+# Long-only, fully invested maximum Sharpe ratio portfolio for an annual mean and covariance
+# x0 warm-starts the solver, e.g. from the previous optimum in a backtest
+def maximize_sharpe_ratio(mean, cov, x0):
+    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones_like(x)})
+    bounds = tuple((0, 1) for _ in range(len(mean)))
+    return optimization.minimize(fun=negative_sharpe_ratio, x0=x0, args=(mean, cov), jac=True,
+                                 method='SLSQP', bounds=bounds, constraints=constraints)
+
 # Minimize f(x) = 0, where sum of weights equivalent to 1
 def optimize_portfolio(weights, returns, stocks):
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1})
-    bounds = tuple((0, 1) for _ in range(len(stocks)))
-    optimum = optimization.minimize(fun=minimize_sharpe_ratio, x0=weights[0], args=returns,
-                                    method='SLSQP', bounds=bounds, constraints=constraints)
+    mean, cov = annual_statistics(returns)
+    optimum = maximize_sharpe_ratio(mean, cov, weights[0])
     print('Optimal portfolio: ' + str(optimum['x'].round(3)))
     print('Expected return, volatility and Sharpe ratio: ' + str(portfolio_statistics(optimum['x'].round(3), returns)))
     return optimum
 
+# Exact efficient frontier, minimum variance w^T C w for a ladder of target returns w^T mu,
+# fully invested and long only, each point warm-started from the previous solution
+def efficient_frontier(returns, points=50):
+    mean, cov = annual_statistics(returns)
+    assets = len(mean)
+    bounds = tuple((0, 1) for _ in range(assets))
+    budget = {'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones_like(x)}
+
+    def variance(x):
+        cov_x = cov @ x
+        return x @ cov_x, 2 * cov_x
+
+    # The frontier starts at the global minimum variance portfolio and ends at the best single asset
+    start = optimization.minimize(fun=variance, x0=np.full(assets, 1 / assets), jac=True,
+                                  method='SLSQP', bounds=bounds, constraints=[budget])
+    targets = np.linspace(start['x'] @ mean, mean.max(), points)
+
+    weights = np.empty((points, assets))
+    x = start['x']
+    for i, target in enumerate(targets):
+        level = {'type': 'eq', 'fun': lambda x, target=target: x @ mean - target, 'jac': lambda x: mean}
+        x = optimization.minimize(fun=variance, x0=x, jac=True, method='SLSQP',
+                                  bounds=bounds, constraints=[budget, level])['x']
+        weights[i] = x
+
+    frontier_returns = weights @ mean
+    frontier_risks = np.sqrt(np.einsum('ij,ij->i', weights @ cov, weights))
+    return weights, frontier_returns, frontier_risks
+
 # Plot data
 def plot_data(data):
     data.plot(figsize=(10, 6))
@@ -96,5 +150,13 @@ def plot_optimal_portfolio(opt, returns, portfolio_returns, vol):
     plt.plot(portfolio_statistics(opt['x'], returns)[1], portfolio_statistics(opt['x'], returns)[0], 'g*', markersize=20.0)
     plt.show()
 
-
-
+# Plot random portfolios together with the efficient frontier
+def plot_efficient_frontier(portfolio_returns, vol, frontier_returns, frontier_vol):
+    plt.figure(figsize=(10, 6))
+    plt.grid(True)
+    plt.scatter(vol, portfolio_returns, c=portfolio_returns/vol, marker='o')
+    plt.plot(frontier_vol, frontier_returns, 'r-', linewidth=2.0)
+    plt.xlabel('Expected Volatility')
+    plt.ylabel('Expected Return')
+    plt.colorbar(label='Sharpe Ratio')
+    plt.show()
@@ -1,44 +1,207 @@
 # Monte Carlo Simulation Black Scholes
 
+import os
+import time
 import numpy as np
+from scipy import stats
+from StreamingStatistics import RunningStatistics
+from ParallelMonteCarlo import spawn_sources, split_paths, run_workers
+from RandomSources import AntitheticSource, make_random_source, convergence_benchmark
+from BlackScholes import batch_option_pricer
+
+# Two-sided confidence interval around a Monte-Carlo estimate
+def confidence_interval(estimate, std_error, confidence=0.95):
+    z = stats.norm.ppf(0.5 + confidence / 2)
+    return estimate - z * std_error, estimate + z * std_error
 
 class MonteCarloSimulation:
-    def __init__(self, iterations, stock_price, strike_price, time_to_maturity, risk_free_rate, volatility):
+    def __init__(self, iterations, stock_price, strike_price, time_to_maturity, risk_free_rate, volatility, seed=None, random_source='pseudo'):
         self.iterations = iterations
         self.stock_price = stock_price
         self.strike_price = strike_price
         self.time_to_maturity = time_to_maturity
         self.risk_free_rate = risk_free_rate
         self.volatility = volatility
+        # 'pseudo', 'antithetic', 'sobol' or any object with a normals(size) method,
+        # and a spawn(seed) method for the parallel simulation
+        self.random_source = make_random_source(random_source, seed)
+
+    # S(T) price for standard normal draws
+    def terminal_price(self, random):
+        drift = self.time_to_maturity * (self.risk_free_rate - 0.5 * self.volatility ** 2)
+        return self.stock_price * np.exp(drift + self.volatility * np.sqrt(self.time_to_maturity) * random)
+
+    # max(0, S-E) for call option, max(0, E-S) for put option
+    def payoff(self, price, option_type='call'):
+        if option_type == 'call':
+            return np.maximum(price - self.strike_price, 0)
+        if option_type == 'put':
+            return np.maximum(self.strike_price - price, 0)
+        raise ValueError('Warning: option type must be call or put')
 
     # Monte-Carlo simulation for put option
     def simulate_put_option(self):
-        # 1st column 0-filled, 2nd column payoff
-        # Payoff function: max(0, E-S) for call option, where E = strike price, S = stock price
-        data = np.zeros([self.iterations, 2])
         # 1D array w/ n items, where n = iterations
-        random = np.random.normal(0, 1, [1, self.iterations])
-        # S(t) price
-        price = self.stock_price * np.exp(self.time_to_maturity * (self.risk_free_rate - 0.5 * self.volatility **2) + self.volatility * np.sqrt(self.time_to_maturity) * random)
-        # E-S, E = strike price, S = stock price
-        data[:,1] = self.strike_price - price
-        # Average for Monte-Carlo, where amax(data, axis=1) returns max(0, E-S)
-        avg = np.sum(np.amax(data, axis=1)) / float(self.iterations)
+        random = self.random_source.normals(self.iterations)
+        # Average for Monte-Carlo of max(0, E-S), E = strike price, S = stock price
+        avg = np.mean(self.payoff(self.terminal_price(random), 'put'))
         # Use exp(-rT) discount factor, where r = risk-free rate, T = time to maturity
         return np.exp(-1 * self.risk_free_rate * self.time_to_maturity) * avg
-    
+
     # Monte-Carlo simulation for call option
     def simulate_call_option(self):
-        # 1st column 0-filled, 2nd column payoff
-        # Payoff function: max(0, S-E) for call option, where S = stock price, E = strike price
-        data = np.zeros([self.iterations, 2])
         # 1D array w/ n items, where n = iterations
-        random = np.random.normal(0, 1, [1, self.iterations])
-        # S(t) price
-        price = self.stock_price * np.exp(self.time_to_maturity * (self.risk_free_rate - 0.5 * self.volatility ** 2) + self.volatility * np.sqrt(self.time_to_maturity) * random)
-        # S-E, S = stock price, E = strike price
-        data[:,1] = price - self.strike_price
-        # Average for Monte-Carlo, where amax(data, axis=1) returns max(0, S-E)
-        avg = np.sum(np.amax(data, axis=1)) / float(self.iterations)
+        random = self.random_source.normals(self.iterations)
+        # Average for Monte-Carlo of max(0, S-E), S = stock price, E = strike price
+        avg = np.mean(self.payoff(self.terminal_price(random), 'call'))
         # Use exp(-rT) discount factor, where r = risk-free rate, T = time to maturity
         return np.exp(-1 * self.risk_free_rate * self.time_to_maturity) * avg
+
+    # Pairing z with -z on top of an AntitheticSource would mirror draws that are already mirrored,
+    # so every pair would appear twice and the standard error would be understated by about sqrt(2)
+    def check_antithetic(self, antithetic):
+        if antithetic and isinstance(self.random_source, AntitheticSource):
+            raise ValueError('Warning: antithetic=True with an antithetic random source pairs every draw twice, '
+                             'use antithetic=False or another source')
+
+    # Discounted payoffs and discounted S(T) control for standard normal draws
+    # With antithetic pairs each sample is the average over z and -z
+    def discounted_samples(self, random, option_type='call', antithetic=True):
+        discount = np.exp(-self.risk_free_rate * self.time_to_maturity)
+        price = self.terminal_price(random)
+        values = discount * self.payoff(price, option_type)
+        controls = discount * price
+        if antithetic:
+            price = self.terminal_price(-random)
+            values = 0.5 * (values + discount * self.payoff(price, option_type))
+            controls = 0.5 * (controls + discount * price)
+        return values, controls
+
+    # Variance-reduced Monte-Carlo simulation, returns (price, standard error, confidence interval)
+    # antithetic: pair each draw z with -z and average the pair
+    # control_variate: regress on the discounted S(T), whose Black-Scholes expectation is S(0)
+    # moment_matching: rescale the draws to exactly zero mean and unit variance
+    def simulate_option(self, option_type='call', antithetic=True, control_variate=True, moment_matching=True, confidence=0.95):
+        self.check_antithetic(antithetic)
+        samples = self.iterations // 2 if antithetic else self.iterations
+        random = self.random_source.normals(samples)
+        if moment_matching:
+            if not antithetic:
+                random -= random.mean()
+            random /= np.sqrt(np.mean(random ** 2))
+
+        # Antithetic pairs are the independent samples
+        values, controls = self.discounted_samples(random, option_type, antithetic)
+        del random
+
+        if control_variate:
+            controls -= self.stock_price
+            beta = np.dot(values - values.mean(), controls) / np.dot(controls - controls.mean(), controls)
+            values -= beta * controls
+
+        estimate = values.mean()
+        std_error = values.std(ddof=1) / np.sqrt(samples)
+        return estimate, std_error, confidence_interval(estimate, std_error, confidence)
+
+    # Streaming Monte-Carlo simulation with bounded memory
+    # Paths are drawn chunk_size at a time and folded into running (Welford) statistics
+    # Stops at self.iterations paths, or earlier once target_std_error or time_budget (seconds) is reached
+    # Returns (price, standard error, confidence interval, paths simulated)
+    def simulate_option_streaming(self, option_type='call', chunk_size=1000000, target_std_error=None, time_budget=None,
+                                  antithetic=True, control_variate=True, confidence=0.95):
+        self.check_antithetic(antithetic)
+        start = time.perf_counter()
+        statistics = RunningStatistics(2)
+        paths = 0
+        while paths < self.iterations:
+            size = min(chunk_size, self.iterations - paths)
+            # Antithetic chunks draw half as many normals, one per pair
+            draws = size // 2 if antithetic else size
+            if draws == 0:
+                break
+            statistics.merge(self.chunk_statistics(draws, option_type, antithetic))
+            paths += 2 * draws if antithetic else draws
+
+            estimate, std_error = self.streaming_estimate(statistics, control_variate)
+            if target_std_error is not None and std_error <= target_std_error:
+                break
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+
+        estimate, std_error = self.streaming_estimate(statistics, control_variate)
+        return estimate, std_error, confidence_interval(estimate, std_error, confidence), paths
+
+    # Running statistics of (discounted payoff, discounted S(T)) for one chunk of draws
+    def chunk_statistics(self, draws, option_type='call', antithetic=True):
+        random = self.random_source.normals(draws)
+        values, controls = self.discounted_samples(random, option_type, antithetic)
+        return RunningStatistics(2).update(np.column_stack((values, controls)))
+
+    # Running statistics over all self.iterations paths, drawn chunk_size at a time
+    def option_statistics(self, option_type='call', chunk_size=1000000, antithetic=True):
+        self.check_antithetic(antithetic)
+        statistics = RunningStatistics(2)
+        paths = self.iterations // 2 if antithetic else self.iterations
+        for start in range(0, paths, chunk_size):
+            statistics.merge(self.chunk_statistics(min(chunk_size, paths - start), option_type, antithetic))
+        return statistics
+
+    # Parallel Monte-Carlo simulation, returns (price, standard error, confidence interval)
+    # Paths are split across workers, each drawing from its own SeedSequence-spawned generator,
+    # and the partial statistics are merged in worker order, so a given seed and worker count
+    # always reproduce the same result bit for bit
+    def simulate_option_parallel(self, option_type='call', workers=None, seed=None, chunk_size=1000000, executor='process',
+                                 antithetic=True, control_variate=True, confidence=0.95):
+        self.check_antithetic(antithetic)
+        workers = workers or os.cpu_count()
+        parameters = (self.stock_price, self.strike_price, self.time_to_maturity, self.risk_free_rate, self.volatility)
+        # Split whole antithetic pairs so every worker simulates an even number of paths,
+        # also when the pairs come from an antithetic source
+        unit = 2 if antithetic or isinstance(self.random_source, AntitheticSource) else 1
+        tasks = [(parameters, unit * paths, source, option_type, chunk_size, antithetic)
+                 for paths, source in zip(split_paths(self.iterations // unit, workers),
+                                          spawn_sources(self.random_source, seed, workers))]
+
+        statistics = RunningStatistics(2)
+        for partial in run_workers(option_statistics_worker, tasks, executor):
+            statistics.merge(partial)
+        estimate, std_error = self.streaming_estimate(statistics, control_variate)
+        return estimate, std_error, confidence_interval(estimate, std_error, confidence)
+
+    # Price and standard error from running statistics of (discounted payoff, discounted S(T))
+    def streaming_estimate(self, statistics, control_variate=True):
+        if statistics.count < 3:
+            return statistics.mean[0], np.inf
+        if control_variate:
+            return statistics.control_variate_estimate([self.stock_price])
+        return statistics.mean[0], statistics.std_error()[0]
+
+# Worker entry point for simulate_option_parallel, kept at module level so process pools can pickle it
+def option_statistics_worker(parameters, paths, source, option_type, chunk_size, antithetic):
+    simulation = MonteCarloSimulation(paths, *parameters, random_source=source)
+    return simulation.option_statistics(option_type, chunk_size, antithetic)
+
+# Scaling benchmark of the parallel simulation from 1 to max_workers workers
+def benchmark_parallel_scaling(iterations=20000000, max_workers=None, executor='process', seed=0):
+    max_workers = max_workers or os.cpu_count()
+    simulation = MonteCarloSimulation(iterations, 100, 100, 1, 0.04, 0.2)
+    report = []
+    for workers in sorted({min(2 ** i, max_workers) for i in range(max_workers.bit_length() + 1)}):
+        start = time.perf_counter()
+        price, std_error, _ = simulation.simulate_option_parallel('call', workers, seed, executor=executor)
+        elapsed = time.perf_counter() - start
+        speedup = report[0]['seconds'] / elapsed if report else 1.0
+        report.append({'workers': workers, 'seconds': elapsed, 'speedup': speedup,
+                       'efficiency': speedup / workers, 'price': price, 'std_error': std_error})
+        print('workers: %d, seconds: %.3f, speedup: %.2f, efficiency: %.2f' % (workers, elapsed, speedup, speedup / workers))
+    return report
+
+# Convergence of the plain estimator under pseudo-random, antithetic and Sobol draws,
+# measured against the Black-Scholes price
+def benchmark_random_sources(path_counts=tuple(2 ** p for p in range(10, 19)), replications=16):
+    exact, _ = batch_option_pricer(100, 100, 1, 0.04, 0.2)
+
+    def estimator(paths, source):
+        return MonteCarloSimulation(paths, 100, 100, 1, 0.04, 0.2, random_source=source).simulate_call_option()
+
+    return convergence_benchmark(estimator, float(exact), path_counts, replications)
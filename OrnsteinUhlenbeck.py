@@ -1,5 +1,6 @@
 import numpy as np
 from numpy.random import normal
+from scipy import signal
 import matplotlib.pyplot as plt
 
 def generate_ou_process(dt=0.1, mean_reversion_rate=1.2, mean=0.9, std=0.9, n=10000):
@@ -14,4 +15,81 @@ def plot_ou_process(x):
     plt.xlabel('t')
     plt.ylabel('x(t)')
     plt.title('Ornstein-Uhlenbeck Process')
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+# Exact OU transition over one step of length dt:
+# x(t+dt) = x(t) * a + mean * (1 - a) + noise * Z, with a = exp(-rate * dt)
+# Without mean reversion (rate = 0) the process is a Brownian motion and the noise is std * sqrt(dt)
+def ou_transition(dt, mean_reversion_rate, std):
+    mean_reversion_rate = np.asarray(mean_reversion_rate, dtype=float)
+    decay = np.exp(-mean_reversion_rate * dt)
+    reverting = mean_reversion_rate != 0
+    safe_rate = np.where(reverting, mean_reversion_rate, 1.0)
+    variance = np.where(reverting, -np.expm1(-2 * safe_rate * dt) / (2 * safe_rate), dt)
+    noise = std * np.sqrt(variance)
+    return decay, noise
+
+# Yield the OU paths block_size steps at a time, as (paths, steps in block) arrays
+# Parameters may be scalars or one value per path, x0 is the starting value
+# With scalar parameters each block is one linear filter over all paths, otherwise the steps are
+# vectorized across paths, in both cases only one block is held in memory
+def ou_path_blocks(x0=0.0, dt=0.1, mean_reversion_rate=1.2, mean=0.9, std=0.9, n=10000, paths=1, block_size=1024, seed=None):
+    rng = np.random.default_rng(seed)
+    decay, noise = ou_transition(dt, mean_reversion_rate, std)
+    scalar = all(np.ndim(p) == 0 for p in (mean_reversion_rate, mean, std))
+    if not scalar:
+        # One row of parameters per path
+        mean, decay, noise = (np.reshape(p, (-1, 1)) for p in np.broadcast_arrays(mean, decay, noise))
+    # Work with the deviation from the long-run mean
+    state = np.broadcast_to(np.asarray(x0, dtype=float) - np.ravel(mean), (paths,)).copy()
+
+    for start in range(0, n, block_size):
+        steps = min(block_size, n - start)
+        shocks = noise * rng.standard_normal((paths, steps))
+        if scalar:
+            block, _ = signal.lfilter([1.0], [1.0, -decay], shocks, axis=1, zi=decay * state[:, np.newaxis])
+        else:
+            block = shocks
+            previous = state[:, np.newaxis]
+            for step in range(steps):
+                block[:, step:step + 1] += decay * previous
+                previous = block[:, step:step + 1]
+        state = block[:, -1].copy()
+        block += mean
+        yield block
+
+# Simulate paths x n steps of the OU process with the exact transition, x(t=0) = x0
+def simulate_ou_paths(x0=0.0, dt=0.1, mean_reversion_rate=1.2, mean=0.9, std=0.9, n=10000, paths=1, seed=None):
+    x = np.empty((paths, n))
+    x[:, 0] = x0
+    column = 1
+    for block in ou_path_blocks(x0, dt, mean_reversion_rate, mean, std, n - 1, paths, seed=seed):
+        x[:, column:column + block.shape[1]] = block
+        column += block.shape[1]
+    return x
+
+# Maximum likelihood calibration of (mean reversion rate, mean, std) from observed series
+# series is one series or a (series x observations) array, sampled every dt
+# The exact OU transition is a Gaussian AR(1), so the MLE is the closed-form AR(1) regression
+def calibrate_ou(series, dt=0.1):
+    x = np.atleast_2d(np.asarray(series, dtype=float))
+    previous = x[:, :-1]
+    current = x[:, 1:]
+    previous_mean = previous.mean(axis=1, keepdims=True)
+    current_mean = current.mean(axis=1, keepdims=True)
+    previous_centered = previous - previous_mean
+    current_centered = current - current_mean
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        decay = np.sum(previous_centered * current_centered, axis=1) / np.sum(previous_centered ** 2, axis=1)
+        residuals = current_centered - decay[:, np.newaxis] * previous_centered
+        noise_variance = np.mean(residuals ** 2, axis=1)
+        # Only 0 < a < 1 corresponds to a mean-reverting process
+        decay = np.where((decay > 0) & (decay < 1), decay, np.nan)
+        mean_reversion_rate = -np.log(decay) / dt
+        mean = (current_mean[:, 0] - decay * previous_mean[:, 0]) / (1 - decay)
+        std = np.sqrt(noise_variance * 2 * mean_reversion_rate / (1 - decay ** 2))
+
+    if np.ndim(series) == 1:
+        return mean_reversion_rate[0], mean[0], std[0]
+    return mean_reversion_rate, mean, std
@@ -0,0 +1,37 @@
+# Parallel execution helpers for the Monte Carlo simulations
+# Every worker gets its own SeedSequence-spawned generator and a fixed share of the paths,
+# so results only depend on the seed and the number of workers
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+# Independent child seeds, one per worker
+def spawn_seeds(seed, workers):
+    return np.random.SeedSequence(seed).spawn(workers)
+
+# One random source per worker, spawned from the simulation's source with the child seeds
+# Custom sources need a spawn(seed) method returning an independent source of the same kind
+def spawn_sources(source, seed, workers):
+    if not callable(getattr(source, 'spawn', None)):
+        raise ValueError('Warning: parallel simulation needs a random source with a spawn(seed) method')
+    return [source.spawn(child) for child in spawn_seeds(seed, workers)]
+
+# Split paths as evenly as possible, the first workers take the remainder
+def split_paths(paths, workers):
+    share, remainder = divmod(paths, workers)
+    return [share + (1 if i < remainder else 0) for i in range(workers)]
+
+# Run function(*task) for every task and return the results in task order
+# executor='process' sidesteps the GIL, 'thread' relies on NumPy releasing it inside its kernels
+def run_workers(function, tasks, executor='process'):
+    if len(tasks) == 1:
+        return [function(*tasks[0])]
+    if executor == 'process':
+        pool = ProcessPoolExecutor(max_workers=len(tasks))
+    elif executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers=len(tasks))
+    else:
+        raise ValueError('Warning: executor must be process or thread')
+    with pool:
+        futures = [pool.submit(function, *task) for task in tasks]
+        return [future.result() for future in futures]
@@ -0,0 +1,165 @@
+# Path-dependent Monte Carlo Simulation
+# Time-stepped GBM paths with payoffs accumulated step by step,
+# so only the current prices and each payoff's running state are kept in memory
+
+import numpy as np
+from MonteCarloSimulationBS import confidence_interval
+
+# Asian option on the arithmetic or geometric average of the monitored prices
+class AsianPayoff:
+    def __init__(self, strike_price, option_type='call', average='arithmetic'):
+        if average not in ('arithmetic', 'geometric'):
+            raise ValueError('Warning: average must be arithmetic or geometric')
+        self.strike_price = strike_price
+        self.option_type = option_type
+        self.average = average
+
+    def start(self, prices):
+        self.total = np.zeros_like(prices)
+        self.steps = 0
+
+    def update(self, prices):
+        self.total += prices if self.average == 'arithmetic' else np.log(prices)
+        self.steps += 1
+
+    def payoff(self):
+        average = self.total / self.steps
+        if self.average == 'geometric':
+            average = np.exp(average)
+        return vanilla_payoff(average, self.strike_price, self.option_type)
+
+# Knock-in / knock-out barrier option, monitored at every time step
+# barrier_type is one of up-and-out, up-and-in, down-and-out, down-and-in
+class BarrierPayoff:
+    def __init__(self, strike_price, barrier, barrier_type='up-and-out', option_type='call', rebate=0.0):
+        if barrier_type not in ('up-and-out', 'up-and-in', 'down-and-out', 'down-and-in'):
+            raise ValueError('Warning: invalid barrier type')
+        self.strike_price = strike_price
+        self.barrier = barrier
+        self.barrier_type = barrier_type
+        self.option_type = option_type
+        self.rebate = rebate
+
+    def start(self, prices):
+        self.hit = np.zeros(prices.shape, dtype=bool)
+        self.update(prices)
+
+    def update(self, prices):
+        if self.barrier_type.startswith('up'):
+            self.hit |= prices >= self.barrier
+        else:
+            self.hit |= prices <= self.barrier
+        self.prices = prices
+
+    def payoff(self):
+        vanilla = vanilla_payoff(self.prices, self.strike_price, self.option_type)
+        if self.barrier_type.endswith('out'):
+            return np.where(self.hit, self.rebate, vanilla)
+        return np.where(self.hit, vanilla, self.rebate)
+
+# Lookback option, floating strike when strike_price is None, fixed strike otherwise
+class LookbackPayoff:
+    def __init__(self, option_type='call', strike_price=None):
+        self.option_type = option_type
+        self.strike_price = strike_price
+
+    def start(self, prices):
+        self.maximum = prices.copy()
+        self.minimum = prices.copy()
+        self.update(prices)
+
+    def update(self, prices):
+        np.maximum(self.maximum, prices, out=self.maximum)
+        np.minimum(self.minimum, prices, out=self.minimum)
+        self.prices = prices
+
+    def payoff(self):
+        if self.strike_price is None:
+            # Floating strike: S(T) - min(S) for a call, max(S) - S(T) for a put
+            if self.option_type == 'call':
+                return self.prices - self.minimum
+            return self.maximum - self.prices
+        if self.option_type == 'call':
+            return np.maximum(self.maximum - self.strike_price, 0)
+        return np.maximum(self.strike_price - self.minimum, 0)
+
+# max(0, S-E) for call option, max(0, E-S) for put option
+def vanilla_payoff(prices, strike_price, option_type='call'):
+    if option_type == 'call':
+        return np.maximum(prices - strike_price, 0)
+    if option_type == 'put':
+        return np.maximum(strike_price - prices, 0)
+    raise ValueError('Warning: option type must be call or put')
+
+class PathSimulation:
+    def __init__(self, iterations, stock_price, time_to_maturity, risk_free_rate, volatility, steps, brownian_bridge=False, seed=None):
+        self.iterations = iterations
+        self.stock_price = stock_price
+        self.time_to_maturity = time_to_maturity
+        self.risk_free_rate = risk_free_rate
+        self.volatility = volatility
+        self.steps = steps
+        self.brownian_bridge = brownian_bridge
+        self.rng = np.random.default_rng(seed)
+
+    # Yield the vector of prices over all paths at each monitoring date t_1, ..., t_n = T
+    def step_prices(self):
+        dt = self.time_to_maturity / self.steps
+        drift = (self.risk_free_rate - 0.5 * self.volatility ** 2) * dt
+        log_price = np.full(self.iterations, np.log(self.stock_price))
+
+        if not self.brownian_bridge:
+            for _ in range(self.steps):
+                log_price += drift + self.volatility * np.sqrt(dt) * self.rng.standard_normal(self.iterations)
+                yield np.exp(log_price)
+            return
+
+        # Brownian bridge: draw W(T) first, then fill in each step conditionally on W(t) and W(T),
+        # which puts most of the variance in the first draw and keeps memory at O(paths)
+        terminal = np.sqrt(self.time_to_maturity) * self.rng.standard_normal(self.iterations)
+        brownian = np.zeros(self.iterations)
+        for step in range(self.steps):
+            remaining = self.time_to_maturity - step * dt
+            if step == self.steps - 1:
+                increment = terminal - brownian
+            else:
+                increment = (dt / remaining) * (terminal - brownian) \
+                    + np.sqrt(dt * (remaining - dt) / remaining) * self.rng.standard_normal(self.iterations)
+            brownian += increment
+            log_price += drift + self.volatility * increment
+            yield np.exp(log_price)
+
+    # Full paths x (steps + 1) price matrix including S(0), only when the paths themselves are needed
+    def generate_paths(self):
+        paths = np.empty((self.iterations, self.steps + 1))
+        paths[:, 0] = self.stock_price
+        for step, prices in enumerate(self.step_prices(), start=1):
+            paths[:, step] = prices
+        return paths
+
+    # Price several payoffs from one set of simulated paths
+    # Returns one (price, standard error, confidence interval) per payoff,
+    # plus the full price matrix when store_paths is set
+    def simulate(self, payoffs, confidence=0.95, store_paths=False):
+        initial = np.full(self.iterations, float(self.stock_price))
+        for payoff in payoffs:
+            payoff.start(initial)
+        paths = [initial] if store_paths else None
+
+        for prices in self.step_prices():
+            for payoff in payoffs:
+                payoff.update(prices)
+            if store_paths:
+                paths.append(prices)
+
+        discount = np.exp(-self.risk_free_rate * self.time_to_maturity)
+        results = []
+        for payoff in payoffs:
+            values = discount * payoff.payoff()
+            estimate = values.mean()
+            std_error = values.std(ddof=1) / np.sqrt(self.iterations)
+            results.append((estimate, std_error, confidence_interval(estimate, std_error, confidence)))
+
+        if store_paths:
+            return results, np.column_stack(paths)
+        return results
@@ -0,0 +1,100 @@
+# Portfolio Value at Risk and Expected Shortfall
+# returns is a (days x assets) matrix of simple returns, weights is one vector of position weights
+# or an (assets x portfolios) matrix, in which case every portfolio is evaluated in the same pass
+
+import numpy as np
+from scipy import signal
+
+# Number of losses in the (1 - confidence) tail of a sample of the given size, at least one
+# The product is rounded first, 1 - 0.99 is 0.010000000000000009 and a whole count like 100 * 0.01
+# would otherwise be ceiled one observation too far
+def tail_count(scenarios, confidence):
+    return max(1, int(np.ceil(np.round(scenarios * (1 - confidence), 10))))
+
+# VaR and ES of a loss sample, along axis 0
+# Only a partition around the tail is needed, not a full sort
+def var_es(losses, confidence=0.95):
+    losses = np.asarray(losses, dtype=float)
+    scenarios = losses.shape[0]
+    tail = tail_count(scenarios, confidence)
+    partitioned = np.partition(losses, scenarios - tail, axis=0)
+    # VaR is the smallest loss in the tail, ES the average loss in the tail
+    value_at_risk = partitioned[scenarios - tail]
+    expected_shortfall = partitioned[scenarios - tail:].mean(axis=0)
+    return value_at_risk, expected_shortfall
+
+# Scenario losses of every portfolio, one batched matrix product
+def portfolio_losses(returns, weights, investment=1.0):
+    return -investment * (np.asarray(returns, dtype=float) @ np.asarray(weights, dtype=float))
+
+# Historical simulation, every past day is one scenario
+def historical_var_es(returns, weights, confidence=0.95, investment=1.0):
+    return var_es(portfolio_losses(returns, weights, investment), confidence)
+
+# EWMA (RiskMetrics) volatility of every asset, sigma^2(t) = decay * sigma^2(t-1) + (1 - decay) * r^2(t-1)
+# Returns the volatility for each day and the forecast for the next day
+def ewma_volatility(returns, decay=0.94):
+    returns = np.asarray(returns, dtype=float)
+    squared = returns ** 2
+    initial = squared.mean(axis=0)
+    # The variance for day t only uses returns up to t-1, the first day starts from the sample variance
+    previous = np.vstack((initial, squared[:-1]))
+    variance, _ = signal.lfilter([1 - decay], [1.0, -decay], previous, axis=0, zi=decay * initial[np.newaxis, :])
+    forecast = decay * variance[-1] + (1 - decay) * squared[-1]
+    return np.sqrt(variance), np.sqrt(forecast)
+
+# Filtered historical simulation: past returns are devolatilized by their EWMA volatility
+# and rescaled by today's forecast, so the scenarios reflect current market conditions
+def filtered_historical_var_es(returns, weights, confidence=0.95, decay=0.94, investment=1.0):
+    volatility, forecast = ewma_volatility(returns, decay)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        standardized = np.where(volatility > 0, np.asarray(returns, dtype=float) / volatility, 0.0)
+    return var_es(portfolio_losses(standardized * forecast, weights, investment), confidence)
+
+# Monte Carlo simulation from a multivariate normal or Student-t fitted to the returns
+# Portfolio returns are linear in the asset returns, so each scenario is drawn directly in portfolio space
+# from N(W^T mu, W^T C W), which has exactly the distribution of the simulated positions summed up
+# while costing O(portfolios) instead of O(assets) per scenario
+# The Student-t uses one chi-square mixing variable per scenario, scaled to keep the covariance C
+def monte_carlo_var_es(returns, weights, confidence=0.95, scenarios=1000000, distribution='normal',
+                       degrees_of_freedom=5, investment=1.0, chunk_size=1000000, seed=None):
+    if distribution not in ('normal', 't'):
+        raise ValueError('Warning: distribution must be normal or t')
+    if distribution == 't' and degrees_of_freedom <= 2:
+        raise ValueError('Warning: Student-t needs more than 2 degrees of freedom for a finite covariance')
+    returns = np.asarray(returns, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    matrix = weights.reshape(weights.shape[0], -1)
+
+    rng = np.random.default_rng(seed)
+    mean = returns.mean(axis=0) @ matrix
+    covariance = matrix.T @ np.cov(returns, rowvar=False).reshape(matrix.shape[0], matrix.shape[0]) @ matrix
+    # Eigen-decomposition tolerates the singular covariance of collinear portfolios
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    factor = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+
+    losses = np.empty((scenarios, matrix.shape[1]))
+    for start in range(0, scenarios, chunk_size):
+        size = min(chunk_size, scenarios - start)
+        shocks = rng.standard_normal((size, matrix.shape[1])) @ factor.T
+        if distribution == 't':
+            mixing = np.sqrt((degrees_of_freedom - 2) / rng.chisquare(degrees_of_freedom, size))
+            shocks *= mixing[:, np.newaxis]
+        losses[start:start + size] = -investment * (mean + shocks)
+
+    value_at_risk, expected_shortfall = var_es(losses, confidence)
+    if weights.ndim == 1:
+        return value_at_risk[0], expected_shortfall[0]
+    return value_at_risk, expected_shortfall
+
+# Regression check of the tail count on samples where scenarios * (1 - confidence) is a whole number,
+# the losses 1..n make the expected VaR and ES exact
+def validate_var_es():
+    cases = [(100, 0.99, 100.0, 100.0), (100, 0.95, 96.0, 98.0), (2000, 0.99, 1981.0, 1990.5),
+             (2000, 0.95, 1901.0, 1950.5), (1000, 0.975, 976.0, 988.0), (10, 0.5, 6.0, 8.0), (10, 0.999, 10.0, 10.0)]
+    for scenarios, confidence, expected_var, expected_es in cases:
+        value_at_risk, expected_shortfall = var_es(np.arange(1, scenarios + 1), confidence)
+        if value_at_risk != expected_var or expected_shortfall != expected_es:
+            raise ValueError('Warning: var_es(arange(1, %d), %g) gave (%g, %g), expected (%g, %g)' % (
+                scenarios + 1, confidence, value_at_risk, expected_shortfall, expected_var, expected_es))
+    print('var_es: %d exact tail cases ok' % len(cases))
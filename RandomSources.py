@@ -0,0 +1,87 @@
+# Random sources for the Monte Carlo simulations
+# Every source hands out standard normal draws through normals(size)
+# and builds an independent source of the same kind for a parallel worker through spawn(seed)
+
+import time
+import numpy as np
+from scipy import special
+from scipy.stats import qmc
+
+# Plain pseudo-random normals
+class PseudoRandomSource:
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def normals(self, size):
+        return self.rng.standard_normal(size)
+
+    def spawn(self, seed):
+        return PseudoRandomSource(seed)
+
+# Antithetic normals, the second half of every draw mirrors the first half
+# Only even sizes keep every draw paired with its mirror, so odd sizes are rejected
+class AntitheticSource:
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def normals(self, size):
+        if size % 2 != 0:
+            raise ValueError('Warning: antithetic sources need an even number of draws, got %d' % size)
+        half = self.rng.standard_normal(size // 2)
+        return np.concatenate((half, -half))
+
+    def spawn(self, seed):
+        return AntitheticSource(seed)
+
+# Randomized quasi-Monte Carlo, scrambled Sobol points mapped through the inverse normal CDF
+# Sizes that are powers of 2 keep the balance properties of the sequence
+# The iid standard error does not apply to a single scrambled sequence,
+# error bars should come from independent scramblings (different seeds)
+class SobolSource:
+    def __init__(self, seed=None, dimension=1):
+        self.dimension = dimension
+        self.sampler = qmc.Sobol(d=dimension, scramble=True, seed=np.random.default_rng(seed))
+
+    # An independent scrambling of the same dimension
+    def spawn(self, seed):
+        return SobolSource(seed, self.dimension)
+
+    def normals(self, size):
+        uniforms = self.sampler.random(size)
+        # Guard the inverse CDF against points landing exactly on 0
+        np.clip(uniforms, np.finfo(float).tiny, 1 - np.finfo(float).eps, out=uniforms)
+        normals = special.ndtri(uniforms)
+        return normals[:, 0] if self.dimension == 1 else normals
+
+RANDOM_SOURCES = {'pseudo': PseudoRandomSource, 'antithetic': AntitheticSource, 'sobol': SobolSource}
+
+# Build a source by name ('pseudo', 'antithetic', 'sobol'), or pass an existing source through
+def make_random_source(source='pseudo', seed=None):
+    if not isinstance(source, str):
+        return source
+    if source not in RANDOM_SOURCES:
+        raise ValueError('Warning: random source must be one of ' + str(list(RANDOM_SOURCES)))
+    return RANDOM_SOURCES[source](seed)
+
+# Error vs. path count and wall time for each random source
+# estimator(paths, source) returns one estimate, exact is the true value
+# Every replication uses an independent seed (an independent scrambling for Sobol)
+def convergence_benchmark(estimator, exact, path_counts, replications=16, sources=('pseudo', 'antithetic', 'sobol')):
+    report = {}
+    for name in sources:
+        rows = []
+        for paths in path_counts:
+            errors = []
+            start = time.perf_counter()
+            for seed in range(replications):
+                errors.append(estimator(paths, make_random_source(name, seed)) - exact)
+            elapsed = (time.perf_counter() - start) / replications
+            rmse = np.sqrt(np.mean(np.square(errors)))
+            rows.append((paths, rmse, elapsed))
+            print('%s, paths: %d, rmse: %.3e, seconds: %.4f' % (name, paths, rmse, elapsed))
+        # Empirical convergence order, RMSE ~ paths^(-rate)
+        rows = np.array(rows)
+        rate = -np.polyfit(np.log(rows[:, 0]), np.log(rows[:, 1]), 1)[0]
+        print('%s convergence rate: %.2f' % (name, rate))
+        report[name] = {'paths': rows[:, 0].astype(int), 'rmse': rows[:, 1], 'seconds': rows[:, 2], 'rate': rate}
+    return report
@@ -0,0 +1,143 @@
+# Rolling-window backtests for Markowitz portfolios and VaR
+# Window mean and covariance are updated incrementally as the window slides,
+# so every date costs O(assets^2) instead of O(window * assets^2)
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from MarkowitzModel import TRADING_DAYS, maximize_sharpe_ratio
+from PortfolioRisk import tail_count
+
+# Running mean and covariance over a sliding window with rank-one add and remove updates
+class RollingMoments:
+    def __init__(self, assets):
+        self.count = 0
+        self.mean = np.zeros(assets)
+        # Sum of outer products of deviations from the mean
+        self.comoment = np.zeros((assets, assets))
+
+    # Welford update for one new observation
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.comoment += np.outer(delta, x - self.mean)
+
+    # Exact reverse of add, for the observation leaving the window
+    def remove(self, x):
+        self.count -= 1
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.comoment -= np.outer(delta, x - self.mean)
+
+    # Recompute from the window directly, which clears accumulated rounding error
+    def reset(self, window):
+        self.count = len(window)
+        self.mean = window.mean(axis=0)
+        centered = window - self.mean
+        self.comoment = centered.T @ centered
+
+    def covariance(self):
+        return self.comoment / (self.count - 1)
+
+# Iterate over (date index, window moments) for every date from window onwards
+# The moments cover the window days before the date, refreshed exactly every refresh dates
+def rolling_moments(returns, window, refresh=250):
+    moments = RollingMoments(returns.shape[1])
+    moments.reset(returns[:window])
+    for t in range(window, len(returns)):
+        if t > window:
+            if (t - window) % refresh == 0:
+                moments.reset(returns[t - window:t])
+            else:
+                moments.add(returns[t - 1])
+                moments.remove(returns[t - window - 1])
+        yield t, moments
+
+def as_array(returns):
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=float), returns.index, list(returns.columns)
+    returns = np.asarray(returns, dtype=float)
+    return returns, pd.RangeIndex(len(returns)), list(range(returns.shape[1]))
+
+# Rolling maximum Sharpe ratio backtest on log returns
+# Weights for each date come from the window before it, warm-started from the previous date's optimum
+# Returns (weights per date, realized portfolio return per date)
+def rolling_markowitz_backtest(returns, window=252, refresh=250):
+    values, index, columns = as_array(returns)
+    assets = values.shape[1]
+    weights = np.empty((len(values) - window, assets))
+    realized = np.empty(len(values) - window)
+    previous = np.full(assets, 1 / assets)
+
+    for t, moments in rolling_moments(values, window, refresh):
+        optimum = maximize_sharpe_ratio(moments.mean * TRADING_DAYS, moments.covariance() * TRADING_DAYS, previous)
+        previous = optimum['x']
+        weights[t - window] = previous
+        realized[t - window] = values[t] @ previous
+
+    dates = index[window:]
+    return pd.DataFrame(weights, index=dates, columns=columns), pd.Series(realized, index=dates, name='return')
+
+# Kupiec proportion-of-failures test, returns (likelihood ratio, p-value)
+# Under a correct model the exceedance rate is 1 - confidence
+def kupiec_test(exceedances, confidence=0.95):
+    exceedances = np.asarray(exceedances, dtype=bool)
+    n = len(exceedances)
+    x = int(exceedances.sum())
+    p = 1 - confidence
+    observed = x / n
+
+    def log_likelihood(rate):
+        # 0 * log(0) is taken as 0
+        ll = 0.0
+        if n - x > 0:
+            ll += (n - x) * np.log(1 - rate)
+        if x > 0:
+            ll += x * np.log(rate)
+        return ll
+
+    ratio = max(0.0, -2 * (log_likelihood(p) - log_likelihood(observed)))
+    return ratio, stats.chi2.sf(ratio, 1)
+
+# Rolling VaR backtest with exceedance and Kupiec statistics
+# weights is one vector, or one row per backtest date (e.g. the output of rolling_markowitz_backtest)
+# method='normal' uses the incrementally updated window mean and covariance,
+# method='historical' the empirical quantile of the window's portfolio losses
+def rolling_var_backtest(returns, weights, window=252, confidence=0.95, method='normal', refresh=250):
+    if method not in ('normal', 'historical'):
+        raise ValueError('Warning: method must be normal or historical')
+    values, index, _ = as_array(returns)
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim == 1:
+        weights = np.broadcast_to(weights, (len(values) - window, values.shape[1]))
+
+    quantile = stats.norm.ppf(confidence)
+    value_at_risk = np.empty(len(values) - window)
+    losses = np.empty(len(values) - window)
+
+    if method == 'normal':
+        for t, moments in rolling_moments(values, window, refresh):
+            w = weights[t - window]
+            value_at_risk[t - window] = -(moments.mean @ w) + quantile * np.sqrt(w @ moments.covariance() @ w)
+            losses[t - window] = -(values[t] @ w)
+    else:
+        tail = tail_count(window, confidence)
+        for t in range(window, len(values)):
+            w = weights[t - window]
+            window_losses = -(values[t - window:t] @ w)
+            value_at_risk[t - window] = np.partition(window_losses, window - tail)[window - tail]
+            losses[t - window] = -(values[t] @ w)
+
+    exceedances = losses > value_at_risk
+    ratio, p_value = kupiec_test(exceedances, confidence)
+    report = {
+        'observations': len(exceedances),
+        'exceedances': int(exceedances.sum()),
+        'exceedance_rate': exceedances.mean(),
+        'expected_rate': 1 - confidence,
+        'kupiec_statistic': ratio,
+        'kupiec_p_value': p_value,
+    }
+    results = pd.DataFrame({'value_at_risk': value_at_risk, 'loss': losses, 'exceedance': exceedances}, index=index[window:])
+    return results, report
@@ -0,0 +1,59 @@
+# Running statistics for chunked Monte Carlo simulations
+# Keeps only the count, mean and co-moment matrix, so memory does not grow with the number of samples
+
+import numpy as np
+
+class RunningStatistics:
+    def __init__(self, dimension=1):
+        self.count = 0
+        self.mean = np.zeros(dimension)
+        # Sum of outer products of deviations from the mean
+        self.comoment = np.zeros((dimension, dimension))
+
+    # Add a chunk of samples, one row per sample and one column per variable
+    def update(self, samples):
+        samples = np.asarray(samples, dtype=float)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        if len(samples) == 0:
+            return self
+        mean = samples.mean(axis=0)
+        centered = samples - mean
+        self.merge_moments(len(samples), mean, centered.T @ centered)
+        return self
+
+    # Combine with statistics accumulated elsewhere, e.g. by another worker
+    def merge(self, other):
+        self.merge_moments(other.count, other.mean, other.comoment)
+        return self
+
+    # Chan et al. pairwise update of Welford's running mean and co-moment
+    def merge_moments(self, count, mean, comoment):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.comoment += comoment + np.outer(delta, delta) * (self.count * count / total)
+        self.mean += delta * (count / total)
+        self.count = total
+
+    def covariance(self):
+        if self.count < 2:
+            return np.full_like(self.comoment, np.nan)
+        return self.comoment / (self.count - 1)
+
+    def variance(self):
+        return np.diag(self.covariance())
+
+    # Standard error of each running mean
+    def std_error(self):
+        return np.sqrt(self.variance() / self.count)
+
+    # Mean and standard error of the first variable after regressing on the others as control variates
+    # control_means are the known expectations of the control variables
+    def control_variate_estimate(self, control_means):
+        covariance = self.covariance()
+        beta = np.linalg.solve(covariance[1:, 1:], covariance[1:, 0])
+        estimate = self.mean[0] - beta @ (self.mean[1:] - np.asarray(control_means, dtype=float))
+        variance = covariance[0, 0] - covariance[0, 1:] @ beta
+        return estimate, np.sqrt(max(variance, 0.0) / self.count)
@@ -1,32 +1,134 @@
 # Value at Risk Monte Carlo Simulation
 
+import os
+import time
 import pandas as pd
 import yfinance as yf
 import numpy as np
+from scipy import stats
+from ParallelMonteCarlo import spawn_sources, split_paths, run_workers
+from RandomSources import AntitheticSource, make_random_source, convergence_benchmark
 
+# Streaming VaR keeps a fixed histogram of the standard normal draws over [-Z_RANGE, Z_RANGE]
+Z_RANGE = 8.0
+Z_BINS = 2 ** 16
 
-def download_adj_close_data(ticker, start_date, end_date):
+
+# With a MarketData.MarketDataCache only the date ranges missing from disk are downloaded
+def download_adj_close_data(ticker, start_date, end_date, cache=None):
     data = {}
+    if cache is not None:
+        data['Adj Close'] = cache.load_ticker(ticker, start_date, end_date, 'Adj Close')
+        return pd.DataFrame(data)
     ticker_data = yf.download(ticker, start_date, end_date)
     data['Adj Close'] = ticker_data['Adj Close']
     return pd.DataFrame(data)
 
 class MonteCarloSimulation:
-    def __init__(self, iterations, investment, mean, std, confidence, days):
+    def __init__(self, iterations, investment, mean, std, confidence, days, seed=None, random_source='pseudo'):
         self.iterations = iterations
         self.investment = investment
         self.mean = mean
         self.std = std
         self.confidence = confidence
         self.days = days
+        # 'pseudo', 'antithetic', 'sobol' or any object with a normals(size) method,
+        # and a spawn(seed) method for the parallel simulation
+        self.random_source = make_random_source(random_source, seed)
+
+    # S(t) asset price for standard normal draws
+    def asset_price(self, random):
+        return self.investment * np.exp(self.days * (self.mean - 0.5 * self.std ** 2) + self.std * np.sqrt(self.days) * random)
 
     def simulate(self):
-        random = np.random.normal(0, 1, [1, self.iterations])
+        random = self.random_source.normals(self.iterations)
         # S(t) asset price
-        asset_price = self.investment * np.exp(self.days * (self.mean - 0.5 * self.std ** 2) + self.std * np.sqrt(self.days) * random)
-        # Sort asset prices to determine percentile
-        asset_price = np.sort(asset_price)
-        # Confidence levels: 95% -> 5, 99% -> 1
+        asset_price = self.asset_price(random)
+        # Confidence levels: 95% -> 5, 99% -> 1, np.percentile only partitions around the quantile
         percentile = np.percentile(asset_price, (1 - self.confidence) * 100)
         return self.investment - percentile
 
+    # Streaming VaR with constant memory
+    # Draws are generated chunk_size at a time and only counted into a fixed histogram of z,
+    # the asset price is increasing in z, so the VaR quantile follows from the quantile of z
+    # Stops at self.iterations draws, or earlier once target_std_error or time_budget (seconds) is reached
+    # Returns (value at risk, standard error, draws simulated)
+    def simulate_streaming(self, chunk_size=1000000, target_std_error=None, time_budget=None):
+        start = time.perf_counter()
+        counts = np.zeros(Z_BINS, dtype=np.int64)
+        paths = 0
+        while paths < self.iterations:
+            size = min(chunk_size, self.iterations - paths)
+            counts += self.chunk_counts(size)
+            paths += size
+
+            value_at_risk, std_error = self.streaming_estimate(counts, paths)
+            if target_std_error is not None and std_error <= target_std_error:
+                break
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+
+        value_at_risk, std_error = self.streaming_estimate(counts, paths)
+        return value_at_risk, std_error, paths
+
+    # Histogram counts of z for one chunk of draws
+    def chunk_counts(self, size):
+        random = self.random_source.normals(size)
+        index = ((random + Z_RANGE) * (Z_BINS / (2 * Z_RANGE))).astype(np.int64)
+        return np.bincount(np.clip(index, 0, Z_BINS - 1), minlength=Z_BINS)
+
+    # Histogram counts over all self.iterations draws, drawn chunk_size at a time
+    def histogram_counts(self, chunk_size=1000000):
+        counts = np.zeros(Z_BINS, dtype=np.int64)
+        for start in range(0, self.iterations, chunk_size):
+            counts += self.chunk_counts(min(chunk_size, self.iterations - start))
+        return counts
+
+    # Parallel VaR simulation, returns (value at risk, standard error)
+    # Each worker draws from its own SeedSequence-spawned generator and the histograms are summed,
+    # so a given seed and worker count always reproduce the same result
+    def simulate_parallel(self, workers=None, seed=None, chunk_size=1000000, executor='process'):
+        workers = workers or os.cpu_count()
+        parameters = (self.investment, self.mean, self.std, self.confidence, self.days)
+        # An antithetic source only hands out whole pairs, so every worker gets an even share
+        unit = 2 if isinstance(self.random_source, AntitheticSource) else 1
+        if self.iterations % unit != 0:
+            raise ValueError('Warning: antithetic sources need an even number of iterations')
+        tasks = [(parameters, unit * paths, source, chunk_size)
+                 for paths, source in zip(split_paths(self.iterations // unit, workers),
+                                          spawn_sources(self.random_source, seed, workers))]
+        counts = np.sum(run_workers(histogram_counts_worker, tasks, executor), axis=0)
+        return self.streaming_estimate(counts, self.iterations)
+
+    # VaR from the histogram of z, with the standard error of the sample quantile,
+    # sqrt(p(1-p)/n) / pdf(z_p), carried through the asset price by the delta method
+    def streaming_estimate(self, counts, paths):
+        p = 1 - self.confidence
+        width = 2 * Z_RANGE / Z_BINS
+        cumulative = np.cumsum(counts)
+        target = p * paths
+        index = min(int(np.searchsorted(cumulative, target)), Z_BINS - 1)
+        below = cumulative[index - 1] if index > 0 else 0
+        fraction = (target - below) / counts[index] if counts[index] > 0 else 0.5
+        z = -Z_RANGE + (index + fraction) * width
+
+        price = self.asset_price(z)
+        z_error = np.sqrt(p * (1 - p) / paths) / stats.norm.pdf(z)
+        return self.investment - price, price * self.std * np.sqrt(self.days) * z_error
+
+# Worker entry point for simulate_parallel, kept at module level so process pools can pickle it
+def histogram_counts_worker(parameters, paths, source, chunk_size):
+    simulation = MonteCarloSimulation(paths, *parameters, random_source=source)
+    return simulation.histogram_counts(chunk_size)
+
+# Convergence of the simulated VaR under pseudo-random, antithetic and Sobol draws,
+# measured against the closed-form lognormal VaR
+def benchmark_random_sources(path_counts=tuple(2 ** p for p in range(10, 19)), replications=16,
+                             investment=1000000, mean=0.001, std=0.02, confidence=0.95, days=1):
+    quantile = stats.norm.ppf(1 - confidence)
+    exact = investment - investment * np.exp(days * (mean - 0.5 * std ** 2) + std * np.sqrt(days) * quantile)
+
+    def estimator(paths, source):
+        return MonteCarloSimulation(paths, investment, mean, std, confidence, days, random_source=source).simulate()
+
+    return convergence_benchmark(estimator, exact, path_counts, replications)
@@ -1,226 +1,328 @@
 import math
-from array import array
 import numpy as np
+from scipy import sparse
+from scipy.linalg import lapack
+
+# Extrapolation policies outside [x_0, x_n]
+# flat: hold the end value, linear: continue along the end segment's secant, error: raise ValueError
+EXTRAPOLATION = ('flat', 'linear', 'error')
 
 
 # Interpolator parent class
+# Knots are stored in NumPy arrays, eval locates segments with np.searchsorted
+# and accepts a scalar (returns a float) or an array (returns an array of the same shape)
 class Interpolator:
-    def __init(self, x=[], y=[]):
+    def __init__(self, x=[], y=[], extrapolation='flat'):
         self.length = len(x)
         if self.length != len(y):
             raise ValueError('Warning: x and y coordinates must have the same length')
-        
-        temp = x.copy()
-        temp.sort()
-        if temp != x:
+        if extrapolation not in EXTRAPOLATION:
+            raise ValueError('Warning: extrapolation must be one of ' + str(EXTRAPOLATION))
+
+        self.x_coords = np.array(x, dtype=float)
+        self.y_coords = np.array(y, dtype=float)
+        if np.any(np.diff(self.x_coords) < 0):
             raise ValueError('Warning: x coordinates must be in ascending order')
-        
-        self.x_coords = x
-        self.y_coords = y
+
+        self.extrapolation = extrapolation
+        # Bumped whenever the knots change, so callers can tell when anything derived from the curve is stale
+        self.version = 0
+        self.build()
+
+    # Precompute whatever eval needs from the knots, called whenever the knots change
+    def build(self):
+        pass
 
     def extend(self, x, y):
-        self.x_coords.append(x)
-        self.x_coords.sort()
-        index = self.x_coords.index(x)
-        self.y_coords.insert(index, y)
+        index = np.searchsorted(self.x_coords, x)
+        self.x_coords = np.insert(self.x_coords, index, x)
+        self.y_coords = np.insert(self.y_coords, index, y)
         self.length += 1
+        self.version += 1
+        self.build()
+
+    # Change one knot value, schemes with precomputed tables only refresh what depends on it
+    def update(self, index, y):
+        self.y_coords[index] = y
+        self.version += 1
+        self.refresh(index)
+
+    # Replace all knot values, keeping the x coordinates and anything precomputed from them
+    def set_values(self, y):
+        y = np.array(y, dtype=float)
+        if len(y) != self.length:
+            raise ValueError('Warning: x and y coordinates must have the same length')
+        self.y_coords = y
+        self.version += 1
+        self.refresh(None)
+
+    # Refresh after knot values change, index is the changed knot or None for all of them
+    def refresh(self, index):
+        self.build()
 
     def get_x_coordinates(self):
         return self.x_coords
-    
+
     def get_y_coordinates(self):
         return self.y_coords
-    
+
     def __len__(self):
         return self.length
-    
 
-# Piecewise Linear Interpolator
-class PWL(Interpolator):
+    def copy(self):
+        return type(self)(self.x_coords.copy(), self.y_coords.copy(), self.extrapolation)
 
-    def eval(self, x):
+    def copy_interpolator(self):
+        return self.copy()
+
+    # Segment index i with x_i <= x <= x_(i+1) for points inside the knot range
+    def locate(self, x):
+        return np.clip(np.searchsorted(self.x_coords, x, side='left') - 1, 0, self.length - 2)
+
+    # Interpolated values for points inside the knot range, implemented by each scheme
+    def evaluate(self, x, index):
+        raise NotImplementedError
+
+    # Columns and values of d(value)/d(y) for points inside the knot range, one row per point
+    def interior_jacobian(self, x, index):
+        raise NotImplementedError
+
+    # Sparse Jacobian d(y(x_j))/d(y_k) of the interpolated values at all points x_j w.r.t. the knot values y_k
+    # Every scheme is linear in its knot values, so this is exact and independent of y
+    def jacobian(self, x):
         if self.length == 0:
-            print('This is an empty interpolator')
-            return
-        boolean_vector = []
-        for x_coord in self.x_coords:
-            if x <= x_coord:
-                boolean_vector.append(True)
-            else:
-                boolean_vector.append(False)
-        try:
-            index = boolean_vector.index(True)
-        except:
-            print('Warning: extrapolating out of range')
-            return self.x_coords[-1], self.y_coords[-1]
-        
-        if index == 0:
-            return self.y_coords[0]
-        else:
-            alpha = (x - self.x_coords[index-1]) / (self.x_coords[index] - self.x_coords[index-1])
-            return (1 - alpha) * self.y_coords[index-1] + alpha * self.y_coords[index]
-    
+            raise ValueError('Warning: this is an empty interpolator')
+        points = np.atleast_1d(np.asarray(x, dtype=float)).ravel()
+        count = len(points)
+        left = points < self.x_coords[0]
+        right = points > self.x_coords[-1]
+        if self.extrapolation == 'error' and (left.any() or right.any()):
+            raise ValueError('Warning: extrapolating out of range')
+        if self.length == 1:
+            return sparse.csr_matrix(np.ones((count, 1)))
+
+        # Clipping the points makes flat extrapolation fall out of the end segments
+        inside = np.clip(points, self.x_coords[0], self.x_coords[-1])
+        columns, values = self.interior_jacobian(inside, self.locate(inside))
+        rows = np.repeat(np.arange(count), columns.shape[1])
+        columns = columns.ravel()
+        values = values.ravel()
+
+        if self.extrapolation == 'linear':
+            # Continue along the end secants, y_0 + (x - x_0) (y_1 - y_0) / h_0 and likewise on the right
+            n = self.length
+            left_step = (points[left] - self.x_coords[0]) / (self.x_coords[1] - self.x_coords[0])
+            right_step = (points[right] - self.x_coords[-1]) / (self.x_coords[-1] - self.x_coords[-2])
+            left_rows = np.flatnonzero(left)
+            right_rows = np.flatnonzero(right)
+            rows = np.concatenate((rows, left_rows, left_rows, right_rows, right_rows))
+            columns = np.concatenate((columns, np.zeros_like(left_rows), np.ones_like(left_rows),
+                                      np.full_like(right_rows, n - 1), np.full_like(right_rows, n - 2)))
+            values = np.concatenate((values, -left_step, left_step, right_step, -right_step))
+
+        return sparse.csr_matrix((values, (rows, columns)), shape=(count, self.length))
+
+    # d(value)/d(y_bump_index) at x, a float for a scalar x and an array otherwise
     def delta(self, x, bump_index):
-        if self.length == 0:
-            print('This is an empty interpolator')
-            return
         if bump_index >= self.length:
             raise ValueError('Warning: bump index out of range')
-            return
+        column = self.jacobian(x)[:, bump_index].toarray().ravel()
+        if np.ndim(x) == 0:
+            return float(column[0])
+        return column.reshape(np.shape(x))
+
+    def eval(self, x):
+        if self.length == 0:
+            raise ValueError('Warning: this is an empty interpolator')
+        points = np.asarray(x, dtype=float)
+        flat = points.ravel()
+        left = flat < self.x_coords[0]
+        right = flat > self.x_coords[-1]
+        if self.extrapolation == 'error' and (left.any() or right.any()):
+            raise ValueError('Warning: extrapolating out of range')
+
         if self.length == 1:
-            return 1
-        boolean_vector = []
-        for x_coord in self.x_coords:
-            if x <= x_coord:
-                boolean_vector.append(True)
-            else:
-                boolean_vector.append(False)
-        try:
-            index = boolean_vector.index(True)
-        except ValueError:
-            print('Warning: extrapolating out of range')
-            if bump_index == self.length - 1:
-                ret = 1
-            else:
-                ret = 0
-            return ret
-        
-        if (index - 1) > bump_index or index < bump_index:
-            return 0
-        
-        alpha = (x - self.x_coords[index-1]) / (self.x_coords[index] - self.x_coords[index-1])
-        if bump_index == (index - 1):
-            return 1 - alpha
-        if bump_index == index:
-            return alpha
-        
-    def copy_interpolator(self):
-        copy = PWL(self.x_coords, self.y_coords)
-        return copy
-    
+            values = np.full(flat.shape, self.y_coords[0])
+        else:
+            inside = np.clip(flat, self.x_coords[0], self.x_coords[-1])
+            values = self.evaluate(inside, self.locate(inside))
+            if self.extrapolation == 'linear':
+                slope = np.diff(self.y_coords[[0, 1, -2, -1]])[[0, 2]] / np.diff(self.x_coords[[0, 1, -2, -1]])[[0, 2]]
+                values[left] += slope[0] * (flat[left] - self.x_coords[0])
+                values[right] += slope[1] * (flat[right] - self.x_coords[-1])
 
-# Catmull-Rom Spline Interpolator
-class CATMULL_ROM(Interpolator):
-    def __init__(self, x=[], y=[]):
-        super().__init__(x, y)
-        self.coeff = []
-        
-        beta = (self.x_coords[1] - self.x_coords[0]) / (self.x_coords[2] - self.x_coords[0])
+        if points.ndim == 0:
+            return float(values[0])
+        return values.reshape(points.shape)
 
-        beta_matrix = array('i', [0] * 4)
 
-        beta_matrix[0] = (1 - beta) * self.y_coords[0] - self.y_coords[1] + beta * self.y_coords[2]
-        beta_matrix[1] = (beta - 1) * self.y_coords[0] + self.y_coords[1] - beta * self.y_coords[2]
-        beta_matrix[2] = self.y_coords[1] - self.y_coords[0]
-        beta_matrix[3] = self.y_coords[0]
+# Piecewise Linear Interpolator
+class PWL(Interpolator):
 
-        self.coeff.append(beta_matrix.copy())
+    def evaluate(self, x, index):
+        x_left = self.x_coords[index]
+        alpha = (x - x_left) / (self.x_coords[index + 1] - x_left)
+        return (1 - alpha) * self.y_coords[index] + alpha * self.y_coords[index + 1]
 
-        loop_matrix = array('i', [0] * 4)
+    def interior_jacobian(self, x, index):
+        x_left = self.x_coords[index]
+        alpha = (x - x_left) / (self.x_coords[index + 1] - x_left)
+        return np.column_stack((index, index + 1)), np.column_stack((1 - alpha, alpha))
 
-        for i in range(1, self.length-2):
-            loop_alpha = (self.x_coords[i+1] - self.x_coords[i]) / (self.x_coords[i+1] - self.x_coords[i-1])
-            loop_beta = (self.x_coords[i+1] - self.x_coords[i]) / (self.x_coords[i+2] - self.x_coords[i])
 
-            loop_matrix[0] = -loop_alpha * self.y_coords[i-1] + (2 - loop_beta) * self.y_coords[i] + (loop_alpha - 2) * self.y_coords[i+1] + loop_beta * self.y_coords[i+2]
-            loop_matrix[1] = 2 * loop_alpha * self.y_coords[i-1] + (loop_beta - 3) * self.y_coords[i] + (3 - 2 * loop_alpha) * self.y_coords[i+1] - loop_beta * self.y_coords[i+2]
-            loop_matrix[2] = -loop_alpha * self.y_coords[i-1] + loop_alpha * self.y_coords[i+1]
-            loop_matrix[3] = self.y_coords[i]
+# Catmull-Rom Spline Interpolator
+# The cubic coefficients of a segment are linear in the four surrounding knot values:
+# weights[i] maps y[window[i]] to the coefficients (c0, c1, c2, c3) of segment i in the normalized coordinate,
+# so a change of knot values only costs a small matrix-vector product per affected segment
+class CATMULL_ROM(Interpolator):
+    def build(self):
+        n = self.length
+        self.weights = None
+        if n < 3:
+            self.coeff_table = np.zeros((max(n - 1, 0), 4))
+            return
 
-            self.coeff.append(loop_matrix.copy())
+        x = self.x_coords
+        weights = np.zeros((n - 1, 4, 4))
+        start = np.arange(n - 1) - 1
 
-        alpha = (self.x_coords[-1] - self.x_coords[-2]) / (self.x_coords[-1] - self.x_coords[-3])
+        # First segment, window (y_0, y_1, y_2, -)
+        beta = (x[1] - x[0]) / (x[2] - x[0])
+        weights[0] = [[1 - beta, -1, beta, 0], [beta - 1, 1, -beta, 0], [-1, 1, 0, 0], [1, 0, 0, 0]]
+        start[0] = 0
 
-        alpha_matrix = array('i', [0] * 4)
+        # Interior segments, window (y_(i-1), y_i, y_(i+1), y_(i+2))
+        i = np.arange(1, n - 2)
+        a = (x[i + 1] - x[i]) / (x[i + 1] - x[i - 1])
+        b = (x[i + 1] - x[i]) / (x[i + 2] - x[i])
+        zero = np.zeros_like(a)
+        weights[i, 0] = np.column_stack((-a, 2 - b, a - 2, b))
+        weights[i, 1] = np.column_stack((2 * a, b - 3, 3 - 2 * a, -b))
+        weights[i, 2] = np.column_stack((-a, zero, a, zero))
+        weights[i, 3] = [0, 1, 0, 0]
 
-        alpha_matrix[0] = -alpha * self.y_coords[-3] + self.y_coords[-2] + (alpha - 1) * self.y_coords[-1]
-        alpha_matrix[1] = 2 * alpha * self.y_coords[-3] - 2 * self.y_coords[-2] + (2 - 2 * alpha) * self.y_coords[-1]
-        alpha_matrix[2] = -alpha * self.y_coords[-3] + alpha * self.y_coords[-1]
-        alpha_matrix[3] = self.y_coords[-2]
+        # Last segment, window (-, y_(n-3), y_(n-2), y_(n-1))
+        alpha = (x[-1] - x[-2]) / (x[-1] - x[-3])
+        weights[-1] = [[0, -alpha, 1, alpha - 1], [0, 2 * alpha, -2, 2 - 2 * alpha], [0, -alpha, 0, alpha], [0, 0, 1, 0]]
+        start[-1] = n - 4
 
-        self.coeff.append(alpha_matrix.copy())
+        # Slots outside the knots carry zero weight, clipping just keeps the gather in range
+        self.window = np.clip(start[:, np.newaxis] + np.arange(4), 0, n - 1)
+        self.weights = weights
+        self.refresh(None)
 
-    def eval(self, x):
-        if self.length == 0:
-            print('This is an empty interpolator')
+    # Recompute the coefficient table, or only the segments whose window contains knot index
+    def refresh(self, index):
+        if self.weights is None:
+            return
+        if index is None:
+            self.coeff_table = np.einsum('ikj,ij->ik', self.weights, self.y_coords[self.window])
             return
+        rows = np.arange(max(0, index - 2), min(self.length - 2, index + 1) + 1)
+        self.coeff_table[rows] = np.einsum('ikj,ij->ik', self.weights[rows], self.y_coords[self.window[rows]])
 
-        boolean_vector = []
-        for x_coord in self.x_coords:
-            if x <= x_coord:
-                boolean_vector.append(True)
-            else:
-                boolean_vector.append(False)
-        try:
-            index = boolean_vector.index(True)
-        except ValueError:
-            print('Warning: extrapolating out of range')
-            return self.x_coords[-1], self.y_coords[-1]
-        
-        if index == 0:
-            return self.y_coords[0]
-        else:
-            delta = (x - self.x_coords[index - 1]) / (self.x_coords[index] - self.x_coords[index - 1])
-            return self.coeff[index-1][0] * delta**3 + self.coeff[index-1][1] * delta**2 + self.coeff[index-1][2] * delta + self.coeff[index-1][3]
-        
-    def delta(self, x, bump_index):
-        pass
+    def evaluate(self, x, index):
+        if self.length < 3:
+            raise ValueError('Warning: Catmull-Rom interpolation needs at least 3 points')
+        x_left = self.x_coords[index]
+        delta = (x - x_left) / (self.x_coords[index + 1] - x_left)
+        coeff = self.coeff_table[index]
+        return ((coeff[:, 0] * delta + coeff[:, 1]) * delta + coeff[:, 2]) * delta + coeff[:, 3]
+
+    # d(value)/d(y) through the linear map from the window's knot values to the cubic coefficients
+    def interior_jacobian(self, x, index):
+        if self.length < 3:
+            raise ValueError('Warning: Catmull-Rom interpolation needs at least 3 points')
+        x_left = self.x_coords[index]
+        delta = (x - x_left) / (self.x_coords[index + 1] - x_left)
+        powers = np.column_stack((delta ** 3, delta ** 2, delta, np.ones_like(delta)))
+        return self.window[index], np.einsum('ik,ikj->ij', powers, self.weights[index])
 
-    def copy_interpolator(self):
-        copy = CATMULL_ROM(self.x_coords, self.y_coords)
-        return copy
-    
 
 # Natural Spline Interpolator
+# The second derivatives M solve a symmetric positive definite tridiagonal system with M_0 = M_n = 0,
+# factorized once per set of x coordinates (LAPACK dpttrf) and re-solved in O(n) when knot values change
+# The coefficient table holds (a, b, c, d) of a + b u + c u^2 + d u^3 for u = x - x_i on each segment
 class NATURAL_SPLINE(Interpolator):
-    def __init__(self, x=[], y=[]):
-        super().__init__(x, y)
+    def build(self):
+        self.h_values = np.diff(self.x_coords)
+        self.factor = None
+        if self.length >= 3:
+            h = self.h_values
+            diagonal, off_diagonal, info = (h[:-1] + h[1:]) / 3, h[1:-1] / 6, 0
+            # A single interior knot is already its own factorization
+            if self.length > 3:
+                diagonal, off_diagonal, info = lapack.dpttrf(diagonal, off_diagonal)
+            if info != 0 or np.any(diagonal <= 0):
+                raise ValueError('Warning: x coordinates must be strictly ascending')
+            self.factor = (diagonal, off_diagonal)
+        self.refresh(None)
 
-        lhs_matrix = np.zeros((self.length, self.length))
-        lhs_matrix[0][0] = 1
-
-        for i in range(1, self.length-1):
-            lhs_matrix[i][i-1] = (self.x_coords[i] - self.x_coords[i-1]) / 6
-            lhs_matrix[i][i] = (self.x_coords[i+1] - self.x_coords[i-1]) / 3
-            lhs_matrix[i][i+1] = (self.x_coords[i+1] - self.x_coords[i]) / 6
-        
-        lhs_matrix[-1][-1] = 1
-        rhs_array = np.zeros((self.length, 1))
+    # Every knot value enters the right-hand side, so any update re-solves the factorized system
+    def refresh(self, index):
+        h = self.h_values
+        self.fprime = np.zeros(self.length)
+        if self.factor is not None:
+            rhs = np.diff(np.diff(self.y_coords) / h)
+            if self.length > 3:
+                rhs, info = lapack.dpttrs(self.factor[0], self.factor[1], rhs)
+            else:
+                rhs = rhs / self.factor[0]
+            self.fprime[1:-1] = rhs
+        if self.length < 2:
+            self.coeff_table = np.zeros((0, 4))
+            return
+        m = self.fprime
+        self.coeff_table = np.column_stack((
+            self.y_coords[:-1],
+            np.diff(self.y_coords) / h - h * (2 * m[:-1] + m[1:]) / 6,
+            m[:-1] / 2,
+            np.diff(m) / (6 * h),
+        ))
 
-        for i in range(1, self.length-1):
-            rhs_array = (self.y_coords[i+1] - self.y_coords[i]) / (self.x_coords[i+1] - self.x_coords[i]) - (self.y_coords[i] - self.y_coords[i-1]) / (self.x_coords[i] - self.x_coords[i-1])
+    def evaluate(self, x, index):
+        u = x - self.x_coords[index]
+        coeff = self.coeff_table[index]
+        return ((coeff[:, 3] * u + coeff[:, 2]) * u + coeff[:, 1]) * u + coeff[:, 0]
 
-        self.fprime = np.linalg.solve(lhs_matrix, rhs_array)
-    
-    def eval(self, x):
-        if self.length == 0:
-            print('This is an empty interpolator')
-            return
-        boolean_vector = []
-        for x_coord in self.x_coords:
-            if x <= x_coord:
-                boolean_vector.append(True)
-            else:
-                boolean_vector.append(False)
-        try:
-            index = boolean_vector.index(True)
-        except ValueError:
-            print('Warning: extrapolating out of range')
-            return self.x_coords[-1], self.y_coords[-1]
-        
-        if index == 0:
-            return self.y_coords[0]
+    # Rows of the sensitivity of the second derivatives to the knot values, dM/dy = A^-1 D with D the second
+    # difference operator, for the given knots only: A is symmetric, so row i is (A^-1 e_i)^T D,
+    # one solve of the factorized tridiagonal system per knot, D applied through its three diagonals
+    def second_derivative_rows(self, knots):
+        n = self.length
+        rows = np.zeros((len(knots), n))
+        interior = (knots > 0) & (knots < n - 1)
+        if self.factor is None or not interior.any():
+            return rows
+        count = np.count_nonzero(interior)
+        unit = np.zeros((n - 2, count))
+        unit[knots[interior] - 1, np.arange(count)] = 1
+        if n > 3:
+            weights, info = lapack.dpttrs(self.factor[0], self.factor[1], unit)
         else:
-            pos_x = self.x_coords[index] - x
-            neg_x = x - self.x_coords[index-1]
-            h_val = self.x_coords[index] - self.x_coords[index-1]
-            ret = self.fprime[index-1] * pos_x**3 / h_val / 6 + self.fprime[index] * neg_x**3 / h_val / 6 \
-                + (self.y_coords[index-1] / h_val - h_val * self.fprime[index-1] / 6) * pos_x + (self.y_coords[index] / h_val - h_val * self.fprime[index] / 6) * neg_x
-            return ret
-        
-    def delta(self, x, bump_index):
-        pass
+            weights = unit / self.factor[0]
+        weights = weights.T
+        h = self.h_values
+        solved = np.zeros((count, n))
+        solved[:, :-2] += weights / h[:-1]
+        solved[:, 1:-1] -= weights * (1 / h[:-1] + 1 / h[1:])
+        solved[:, 2:] += weights / h[1:]
+        rows[interior] = solved
+        return rows
 
-    def copy_interpolator(self):
-        copy = NATURAL_SPLINE(self.x_coords, self.y_coords)
-        return copy
\ No newline at end of file
+    # The value is linear in y_i, y_(i+1) directly and in M_i, M_(i+1), which depend on every knot,
+    # so each row of the natural spline Jacobian is dense
+    def interior_jacobian(self, x, index):
+        h = self.h_values[index]
+        u = x - self.x_coords[index]
+        weight_left = -h * u / 3 + u ** 2 / 2 - u ** 3 / (6 * h)
+        weight_right = -h * u / 6 + u ** 3 / (6 * h)
+        # Only the knots bounding the intervals that hold points are solved for
+        knots = np.unique(np.concatenate((index, index + 1)))
+        sensitivity = self.second_derivative_rows(knots)
+        left, right = np.searchsorted(knots, index), np.searchsorted(knots, index + 1)
+        values = weight_left[:, np.newaxis] * sensitivity[left] + weight_right[:, np.newaxis] * sensitivity[right]
+        points = np.arange(len(x))
+        values[points, index] += 1 - u / h
+        values[points, index + 1] += u / h
+        return np.broadcast_to(np.arange(self.length), values.shape), values
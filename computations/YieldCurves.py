@@ -1,39 +1,117 @@
-import math
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 import numpy as np
-from Interpolation import *
-
-def newton_solver(interpolator, bond):
-    TOLERANCE = 0.000001
-    coupons = bond.get_coupons()
-    times = bond.get_times()
-    maturity = bond.get_maturity()
-    face_value = bond.get_face_value()
-
-    def f(x):
-        temp = interpolator.copy()
-        temp.extend(maturity, x)
-        sigma = -face_value
-        for i in range(len(times)):
-            sigma += math.exp(-temp.eval(times[i]) * times[i]) * coupons[i]
-        return sigma
-    
-    def f_prime(x):
-        temp = interpolator.copy()
-        temp.extend(maturity, x)
-        max_index = len(temp) - 1
-        sigma = 0
-        for i in range(len(times)):
-            sigma += temp.delta(times[i], max_index) * times[i] * math.exp(-temp.eval(times[i]) * times[i]) * coupons[i]
-        return -sigma
-    
-    prev_x = 0
-    curr_x = prev_x - f(prev_x) / f_prime(prev_x)
-    while abs(curr_x - prev_x) > TOLERANCE:
-        prev_x = curr_x
-        curr_x = prev_x - f(prev_x) / f_prime(prev_x)
+from scipy import sparse
+
+# Importable both from inside computations/ and as computations.YieldCurves from the project root
+try:
+    from computations.Interpolation import *
+except ImportError:
+    from Interpolation import *
+
+INTERPOLATORS = {'pwl': PWL, 'catmull-rom': CATMULL_ROM, 'natural-spline': NATURAL_SPLINE}
+BOOTSTRAP_METHODS = ('sequential', 'newton', 'levenberg-marquardt')
+# Maximum number of scalar tenors kept in a curve's discount factor cache
+CACHE_SIZE = 4096
+
+# Cash flows of all bonds in one flat layout: payment times, amounts and the index of the owning bond
+def cash_flow_layout(bonds):
+    times = np.concatenate([np.asarray(bond.get_times(), dtype=float) for bond in bonds])
+    amounts = np.concatenate([np.asarray(bond.get_coupons(), dtype=float) for bond in bonds])
+    owners = np.repeat(np.arange(len(bonds)), [len(bond.get_times()) for bond in bonds])
+    return times, amounts, owners
+
+# Bootstrap zero rates at the bond maturities so that every bond reprices to its price (face value)
+# Every interpolation scheme is linear in its knot values, so the rates at all cash flow times are J y
+# with the sparse knot Jacobian J computed once, and every pricing pass is one sparse matrix product
+# sequential: one Newton solve per pillar in maturity order, with the later pillars held flat at the
+#   current one, exact for PWL where a bond only depends on the pillars up to its maturity
+# newton, levenberg-marquardt: global solve over all pillars, started from the sequential curve,
+#   needed for an exact fit with the non-local catmull-rom and natural-spline schemes
+# The method defaults to sequential for pwl and newton for the other schemes
+# Returns the interpolator and a report with the iteration count and the pricing residuals,
+# converged means every bond reprices within tolerance relative to the largest price, whatever the method
+def bootstrap(bonds, interpolator='pwl', method=None, tolerance=1e-10, max_iterations=50):
+    if interpolator not in INTERPOLATORS:
+        raise ValueError('Warning: interpolator must be one of ' + str(list(INTERPOLATORS)))
+    if method is None:
+        method = 'sequential' if interpolator == 'pwl' else 'newton'
+    if method not in BOOTSTRAP_METHODS:
+        raise ValueError('Warning: method must be one of ' + str(BOOTSTRAP_METHODS))
+    bonds = sorted(bonds, key=lambda bond: bond.get_maturity())
+    count = len(bonds)
+    tenors = np.array([bond.get_maturity() for bond in bonds], dtype=float)
+    if np.any(np.diff(tenors) <= 0):
+        raise ValueError('Warning: bond maturities must be distinct')
+    prices = np.array([bond.get_face_value() for bond in bonds], dtype=float)
+    if np.any(np.isnan(prices)):
+        raise ValueError('Warning: every bond needs a price (face value)')
+
+    times, amounts, owners = cash_flow_layout(bonds)
+    curve = INTERPOLATORS[interpolator](tenors, np.zeros(count))
+    jacobian = curve.jacobian(times)
+    # Sums cash flows into bond prices
+    ownership = sparse.csr_matrix((np.ones(len(times)), (owners, np.arange(len(times)))), shape=(count, len(times)))
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(owners, minlength=count))))
+
+    def residuals(rates):
+        discounted = amounts * np.exp(-(jacobian @ rates) * times)
+        return ownership @ discounted - prices, discounted
+
+    # d(price_b)/d(y_k) = -sum over the cash flows of b of t * discounted cash flow * J[., k]
+    def residual_jacobian(discounted):
+        return (ownership @ sparse.diags(-times * discounted) @ jacobian).toarray()
 
-    return curr_x
+    rates = np.zeros(count)
+    iterations = 0
+    for i in range(count):
+        rows = jacobian[offsets[i]:offsets[i + 1]].toarray()
+        t = times[offsets[i]:offsets[i + 1]]
+        c = amounts[offsets[i]:offsets[i + 1]]
+        # Rates at the cash flows are base + slope * x when pillars i and beyond are all x
+        base = rows[:, :i] @ rates[:i]
+        slope = rows[:, i:].sum(axis=1)
+        x = rates[i - 1] if i > 0 else 0.0
+        for _ in range(max_iterations):
+            iterations += 1
+            discounted = c * np.exp(-(base + slope * x) * t)
+            step = (discounted.sum() - prices[i]) / -(slope * t * discounted).sum()
+            x -= step
+            if abs(step) < tolerance:
+                break
+        rates[i:] = x
+
+    error, discounted = residuals(rates)
+    if method == 'newton':
+        for _ in range(max_iterations):
+            if np.max(np.abs(error)) < tolerance * np.max(np.abs(prices)):
+                break
+            iterations += 1
+            rates -= np.linalg.solve(residual_jacobian(discounted), error)
+            error, discounted = residuals(rates)
+    elif method == 'levenberg-marquardt':
+        damping = 1e-3
+        for _ in range(max_iterations):
+            if np.max(np.abs(error)) < tolerance * np.max(np.abs(prices)):
+                break
+            iterations += 1
+            matrix = residual_jacobian(discounted)
+            normal = matrix.T @ matrix
+            step = np.linalg.solve(normal + damping * np.diag(np.diag(normal)), matrix.T @ error)
+            trial_error, trial_discounted = residuals(rates - step)
+            # Accept steps that reduce the residual and move towards Gauss-Newton, otherwise damp harder
+            if trial_error @ trial_error < error @ error:
+                rates -= step
+                error, discounted = trial_error, trial_discounted
+                damping /= 10
+            else:
+                damping *= 10
+
+    converged = np.max(np.abs(error)) < tolerance * np.max(np.abs(prices))
+    curve.set_values(rates)
+    report = {'method': method, 'iterations': iterations, 'converged': bool(converged),
+              'residuals': error, 'max_residual': np.max(np.abs(error))}
+    return curve, report
 
 
 # Yield Curves
@@ -43,6 +121,9 @@ class YCurve:
         self.rates = []
         self.length = 0
         self.interpolator = None
+        self.scheme = None
+        self.bootstrap_report = None
+        self.clear_cache()
 
     def rates_constructor(self, tenors, rates, interpolator=None):
         if self.length > 0:
@@ -55,37 +136,29 @@ class YCurve:
         self.rates = rates.copy()
         self.length = len(tenors)
 
-        if interpolator == 'pwl':
-            self.interpolator = PWL(self.tenors, self.rates)
-        elif interpolator == 'catmull-rom':
-            self.interpolator = CATMULL_ROM(self.tenors, self.rates)
-        elif interpolator == 'natural-spline':
-            self.interpolator = NATURAL_SPLINE(self.tenors, self.rates)
-        else:
+        if interpolator not in INTERPOLATORS:
             print('Warning: invalid interpolator, using PWL')
-            self.interpolator = PWL(self.tenors, self.rates)
-
-# For Bonds, only pwl interpolator is available
-    def bonds_constructor(self, bonds):
-        self.interpolator = PWL()
+            interpolator = 'pwl'
+        self.scheme = interpolator
+        self.interpolator = INTERPOLATORS[interpolator](self.tenors, self.rates)
 
+    # Bootstrap the curve from bonds priced at their face value, see bootstrap for the methods
+    # Returns the bootstrap report, also kept in self.bootstrap_report
+    def bonds_constructor(self, bonds, interpolator='pwl', method=None, tolerance=1e-10, max_iterations=50):
         if self.length > 0:
             print('Warning: curve already constructed')
             return
-        
-        def get_maturity(bond):
-            return bond.get_maturity()
-        bonds.sort(key=get_maturity)
 
-        for i in range(len(bonds)):
-            self.interpolator.extend(bonds[i].get_maturity(), newton_solver(self.interpolator, bonds[i]))
-            self.tenors.append(bonds[i].get_maturity())
-            self.rates.append(newton_solver(self.interpolator, bonds[i]))
-            self.length += 1
+        self.interpolator, self.bootstrap_report = bootstrap(bonds, interpolator, method, tolerance, max_iterations)
+        self.scheme = interpolator
+        self.tenors = list(self.interpolator.get_x_coordinates())
+        self.rates = list(self.interpolator.get_y_coordinates())
+        self.length = len(self.tenors)
+        return self.bootstrap_report
 
     def copy(self):
         new = YCurve()
-        new.rates_constructor(tenors=self.tenors, rates=self.rates, interpolator=self.interpolator.copy())
+        new.rates_constructor(tenors=self.tenors, rates=self.rates, interpolator=self.scheme)
         return new
     
     def get_rates(self):
@@ -94,37 +167,70 @@ class YCurve:
     def get_tenors(self):
         return self.tenors
     
-    # Returns continuously compounded spot rate for a given tenor
+    # Replace the rates at the existing tenors, keeping the interpolator's precomputed tables
+    def set_rates(self, rates):
+        if len(rates) != self.length:
+            print('Warning: tenors and rates mismatch')
+            return
+        self.rates = list(rates)
+        self.interpolator.set_values(self.rates)
+
+    # Discount factors of scalar tenors are memoized in a bounded LRU cache
+    # The cache belongs to one version of the interpolator and is dropped as soon as the knots change
+    def clear_cache(self):
+        self.cache = OrderedDict()
+        self.cache_key = None
+
+    # Returns continuously compounded spot rates for a tenor or an array of tenors
     def get_yield(self, tenor):
         return self.interpolator.eval(tenor)
-    
+
+    # Discount factors for a tenor or an array of tenors
+    # Arrays go straight to one vectorized evaluation, scalar lookups repeated in loops hit the cache
     def discount_factor(self, tenor):
-        return math.exp(-self.interpolator.eval(tenor) * tenor)
-    
+        if np.ndim(tenor) > 0:
+            tenors = np.asarray(tenor, dtype=float)
+            return np.exp(-self.interpolator.eval(tenors) * tenors)
+
+        key = (id(self.interpolator), self.interpolator.version)
+        if key != self.cache_key:
+            self.clear_cache()
+            self.cache_key = key
+        tenor = float(tenor)
+        factor = self.cache.get(tenor)
+        if factor is None:
+            factor = float(np.exp(-self.interpolator.eval(tenor) * tenor))
+            self.cache[tenor] = factor
+            if len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(tenor)
+        return factor
+
+    # Simple (compounding=0) or periodically compounded spot rates in percent, for a time or an array of times
     def spot_rate(self, time, compounding=0):
+        if compounding < 0:
+            print('Warning: invalid compounding')
+            return
+        time = np.asarray(time, dtype=float)
+        factors = self.discount_factor(time)
         # Simple
         if compounding == 0:
-            return 100 * (1 / self.discount_factor(time) - 1) / time
-        elif compounding > 0:
-            return 100 * (self.discount_factor(time) ** (-1 / compounding / time) - 1) * compounding
+            rates = 100 * (1 / factors - 1) / time
         else:
-            print('Warning: invalid compounding')
-            return
-        
+            rates = 100 * (factors ** (-1 / compounding / time) - 1) * compounding
+        if time.ndim == 0:
+            return float(rates)
+        return rates
+
     # PLOTTING
     def plot_yield_curve(self, max_tenor=0):
         if max_tenor <= 0:
             max_tenor = max(self.tenors)
 
         fig, ax = plt.subplots()
-        tenor = np.arrange(0, max_tenor, 0.1)
-        yield_curve = []
-
-        for t in tenor:
-            y = self.get_yield(t)
-            yield_curve.append(y)
-
-        yield_curve = np.array(yield_curve)
+        tenor = np.arange(0, max_tenor, 0.1)
+        yield_curve = self.get_yield(tenor)
         
         ax.plot(tenor, yield_curve)
         ax.set(xlabel='Tenor', ylabel='Yield', title='Yield Curve')
@@ -135,14 +241,8 @@ class YCurve:
             max_tenor = max(self.tenors)
 
         fig, ax = plt.subplots()
-        tenor = np.arrange(0, max_tenor, 0.1)
-        discount_curve = []
-
-        for t in tenor:
-            d = self.discount_factor(t)
-            discount_curve.append(d)
-
-        discount_curve = np.array(discount_curve)
+        tenor = np.arange(0, max_tenor, 0.1)
+        discount_curve = self.discount_factor(tenor)
         
         ax.plot(tenor, discount_curve)
         ax.set(xlabel='Tenor', ylabel='Discount Factor', title='Discount Curve')
@@ -150,11 +250,9 @@ class YCurve:
 
     def shift_rates(self, delta: float):
         delta /= 100
-        shifted = []
-        for i in range(self.length):
-            shifted.append(self.rates[i] + delta)
+        shifted = [rate + delta for rate in self.rates]
         curve = YCurve()
-        curve.rates_constructor(rates=shifted, tenors=self.tenors, interpolator=self.interpolator.copy())
+        curve.rates_constructor(rates=shifted, tenors=self.tenors, interpolator=self.scheme)
         return curve
     
     def shift_rate(self, delta: float, index: int):
@@ -162,6 +260,6 @@ class YCurve:
         shifted = self.rates.copy()
         shifted[index] += delta
         curve = YCurve()
-        curve.rates_constructor(rates=shifted, tenors=self.tenors, interpolator=self.interpolator.copy())
+        curve.rates_constructor(rates=shifted, tenors=self.tenors, interpolator=self.scheme)
         return curve
     
\ No newline at end of file